@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark and check of dateformat, the Unicode date pattern formatter of
+attributionclasses.QFDateTime:
+
+  - the week rules (CLDR week data) and names of some locales have to give
+    the same text as NSDateFormatter, and unsupported fields, counts and
+    locales have to be left to NSDateFormatter
+  - for the 'en' locale, patterns have to give the same text as
+    datetime.strftime (in the C locale), and the ISO 8601 weeks of 'de'
+    the same as datetime.isocalendar, for random dates
+  - formatting with a new DateFormatter (compiling the pattern every
+    time), with get_formatter (cached), and with strftime
+
+The exit-status is 1 if any result differs.
+
+Usage: python benchmarks/bench_dateformat.py [dates] [seed]
+"""
+import  datetime, random, sys
+from    common      import bench, usec
+import  dateformat
+
+# Unicode date patterns, and the same as strftime format
+PATTERNS = [
+    (u'EEE MMM dd yyyy HH:mm:ss',           '%a %b %d %Y %H:%M:%S'),
+    (u"EEEE, MMMM d 'at' hh:mm a",          '%A, %B %-d at %I:%M %p'),
+    (u"yyyy-MM-dd'T'HH:mm:ss.SSSSSS D",     '%Y-%m-%dT%H:%M:%S.%f %-j'),
+]
+
+# (date, pattern, locale, text of NSDateFormatter)
+CASES = [
+    # Monday, first week with 1 day (not ISO 8601, which gives 2020-53)
+    ((2021, 1, 2),  u'YYYY-ww e',       'en_AU',    u'2021-01 6'),
+    ((2021, 1, 4),  u'YYYY-ww e',       'en_AU',    u'2021-02 1'),
+    # Sunday, 1 day
+    ((2021, 1, 2),  u'YYYY-ww e',       'en_US',    u'2021-01 7'),
+    ((2021, 1, 3),  u'YYYY-ww e W',     'en_US',    u'2021-02 1 2'),
+    ((2021, 1, 2),  u'YYYY-ww e',       'pt_BR',    u'2021-01 7'),
+    ((2021, 1, 2),  u'YYYY-ww',         'pt',       u'2021-01'),
+    # Sunday, 4 days
+    ((2021, 1, 2),  u'YYYY-ww',         'pt_PT',    u'2020-53'),
+    # Monday, 4 days (ISO 8601)
+    ((2021, 1, 2),  u'YYYY-ww e',       'de_DE',    u'2020-53 6'),
+    ((2021, 1, 3),  u'YYYY-ww e W',     'de_DE',    u'2020-53 7 0'),
+    ((2021, 1, 4),  u'YYYY-ww e W',     'de_DE',    u'2021-01 1 1'),
+    # Saturday
+    ((2021, 1, 2),  u'e',               'en_AE',    u'1'),
+    # names
+    ((2021, 1, 2),  u'EEEE, d MMMM y G', 'pt_BR',   u'sábado, 2 janeiro 2021 d.C.'),
+    ((2021, 1, 2),  u'EEE d MMM',       'de_DE',    u'Sa. 2 Jan.'),
+    ((2021, 1, 6),  u'EEEEE MMMMM',     'es_ES',    u'X E'),
+    ((2021, 5, 1),  u'QQQ QQQQ QQQQQ',  'fr_FR',    u'T2 2e trimestre 2'),
+    ((2021, 5, 1),  u'QQ QQQ QQQQ',     'en_US',    u'02 Q2 2nd quarter'),
+]
+
+# (pattern, locale) to format with NSDateFormatter
+UNSUPPORTED = [
+    (u'GGGG',       'en_US'),
+    (u'GGGGG',      'de_DE'),
+    (u'QQQQQQ',     'en_US'),
+    (u'LLLL',       'de_DE'),
+    (u'EEEEEE',     'fr_FR'),
+    (u'zzzz',       'en_US'),
+    (u'yyyy',       'ja_JP'),
+    (u'yyyy',       'en_US@calendar=japanese'),
+]
+
+def check_cases():
+    failures = 0
+    for day, pattern, locale, text in CASES:
+        new = dateformat.format_datetime(datetime.datetime(*day), pattern, locale)
+        if new != text:
+            failures += 1
+            print "DIFFERENT: %s %r %s -> %r, not %r" % (datetime.date(*day), pattern, locale, new, text)
+    for pattern, locale in UNSUPPORTED:
+        if dateformat.formatters.get(pattern, locale) is not None:
+            failures += 1
+            print "SUPPORTED: %r %s" % (pattern, locale)
+    print "%d cases: %s" % (len(CASES) + len(UNSUPPORTED), failures and "%d failures" % failures or "ok")
+    return failures
+
+def main():
+    number      = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    r           = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    failures    = check_cases()
+    for i in range(number):
+        dt = datetime.datetime(r.randint(1900, 2100), 1, 1) + datetime.timedelta(
+            seconds = r.randrange(366 * 86400), microseconds = r.randrange(10 ** 6))
+        for pattern, fmt in PATTERNS:
+            new, old = dateformat.format_datetime(dt, pattern, 'en'), dt.strftime(fmt).decode('ascii')
+            if new != old:
+                failures += 1
+                print "DIFFERENT: %s %r -> %r, not %r" % (dt, pattern, new, old)
+        new, old = dateformat.format_datetime(dt, u'YYYY-ww', 'de'), u'%04d-%02d' % dt.isocalendar()[:2]
+        if new != old:
+            failures += 1
+            print "DIFFERENT: %s week %r, not %r" % (dt, new, old)
+    print "%d dates: %s" % (number, failures and "%d failures" % failures or "ok")
+
+    print
+    print "%-32s %13s %13s %13s" % ('pattern', 'compiled', 'cached', 'strftime')
+    dt = datetime.datetime(2014, 10, 14, 9, 41, 0)
+    for pattern, fmt in PATTERNS:
+        t_new = bench(lambda: dateformat.DateFormatter(pattern, 'en').format(dt))
+        t_get = bench(lambda: dateformat.get_formatter(pattern, 'en').format(dt))
+        t_str = bench(lambda: dt.strftime(fmt))
+        print "%-32s %s %s %s" % (pattern, usec(t_new), usec(t_get), usec(t_str))
+    sys.exit(failures and 1 or 0)
+
+if __name__ == '__main__':
+    main()
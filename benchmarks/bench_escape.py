@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: pyratemp.escape() versus the previous implementation
+(five str.replace passes), on typical attribution values.
+
+Each value is escaped without ("cold") and with ("memo") the memo of
+recently escaped strings.
+
+Usage: python benchmarks/bench_escape.py
+"""
+from    common      import bench, usec
+import  pyratemp
+
+def escape_replace(s, format = pyratemp.HTML):
+    """ the previous pyratemp.escape() (without LaTeX) """
+    if format is None or format == pyratemp.NONE:
+        pass
+    elif format == pyratemp.HTML:
+        s = s.replace(u"&", u"&amp;") # must be done first!
+        s = s.replace(u"<", u"&lt;")
+        s = s.replace(u">", u"&gt;")
+        s = s.replace(u'"', u"&quot;")
+        s = s.replace(u"'", u"&#39;")
+    else:
+        raise ValueError('Invalid format.')
+    return unicode(s)
+
+VALUES = [
+    u'Tue Oct 14 2014',
+    u'09:41:00',
+    u'jay@example.com',
+    u'J\xf6rg "Jay" O\'Neil',
+    u'J\xf6rg "Jay" O\'Neil <jay@example.com>',
+    u'Re: <quarterly> numbers & plans',
+    u'Person 1 <person1@example.com>, Person 2 <person2@example.com>',
+    u'> quoted line of a longer message body, which does not repeat ' * 8,
+]
+
+def cold(value):
+    # don't memoize anything while measuring
+    maxlen = pyratemp._ESCAPE_MEMO_MAXLEN
+    pyratemp._ESCAPE_MEMO_MAXLEN = -1
+    pyratemp._escape_memo[pyratemp.HTML].clear()
+    try:
+        return bench(lambda: pyratemp.escape(value))
+    finally:
+        pyratemp._ESCAPE_MEMO_MAXLEN = maxlen
+
+def main():
+    print "%-34s %13s %13s %13s" % ('value', 'previous', 'cold', 'memo')
+    for value in VALUES:
+        assert pyratemp.escape(value) == escape_replace(value)
+        print "%-34r %s %s %s" % (value[:32],
+            usec(bench(lambda: escape_replace(value))),
+            usec(cold(value)),
+            usec(bench(lambda: pyratemp.escape(value))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: replaying a stream of events through the MailApp.sendEvent hook
+(events.EventHook), versus the previous hook, which looked at the modifier
+flags of every event.
+
+The stream is shaped like a recording of a few minutes of using Mail:
+mostly mouse moves and scrolling, with some clicks, typing, and Option-R
+replies (the default shortcuts of the hook). The events (and MailApp) are
+fake Python objects; in Mail, every call of an NSEvent-method and every
+attribute of MailApp goes through PyObjC and costs much more, so these are
+counted, too.
+
+Usage: python benchmarks/bench_events.py [events]
+"""
+import  random, sys
+from    common      import bench
+import  events
+from    events      import NSKeyDown, NSFlagsChanged, NSAlternateKeyMask, NSControlKeyMask
+from    events      import NSShiftKeyMask, NSCommandKeyMask
+
+NSLeftMouseDown, NSLeftMouseUp, NSMouseMoved, NSKeyUp, NSScrollWheel = 1, 2, 5, 11, 22
+
+class FakeEvent(object):
+
+    def __init__(self, type, flags = 0, characters = u''):
+        self._type          = type
+        self._flags         = flags
+        self._characters    = characters
+
+    def type(self):
+        return self._type
+
+    def modifierFlags(self):
+        return self._flags
+
+    def charactersIgnoringModifiers(self):
+        return self._characters
+
+    def keyCode(self):
+        # (only used for shortcuts with key codes)
+        return 0
+
+class FakeApp(object):
+
+    def __init__(self):
+        self.toggle_key_active = False
+
+class FakeMailApp(object):
+
+    def __init__(self, app):
+        self.app = app
+
+# counters of: NSEvent-methods called, MailApp-attributes looked up, and
+# App-attributes set
+counts = dict(event = 0, mailapp = 0, app = 0)
+
+class CountingEvent(FakeEvent):
+
+    def type(self):
+        counts['event'] += 1
+        return self._type
+
+    def modifierFlags(self):
+        counts['event'] += 1
+        return self._flags
+
+    def charactersIgnoringModifiers(self):
+        counts['event'] += 1
+        return self._characters
+
+    def keyCode(self):
+        counts['event'] += 1
+        return 0
+
+class CountingApp(FakeApp):
+
+    def __setattr__(self, name, value):
+        counts['app'] += 1
+        FakeApp.__setattr__(self, name, value)
+
+class CountingMailApp(FakeMailApp):
+
+    def __getattribute__(self, name):
+        counts['mailapp'] += 1
+        return FakeMailApp.__getattribute__(self, name)
+
+def strip_option(event):
+    return FakeEvent(event.type(), event.modifierFlags() & ~NSAlternateKeyMask, event.charactersIgnoringModifiers())
+
+def old_sendEvent(self, original, event):
+    """ the previous MailApp.sendEvent """
+    if not hasattr(self, 'app'):
+        original(self, event)
+        return
+    self.app.toggle_key_active = False
+    # keep track of an active option key
+    flags = event.modifierFlags()
+    if (flags & NSAlternateKeyMask) and not (flags & NSControlKeyMask):
+        self.app.toggle_key_active = True
+        # handle reply/reply-all (XXX: won't work if you have assigned
+        # a different shortcut key to these actions!)
+        if event.type() == NSKeyDown and event.charactersIgnoringModifiers().lower() == 'r':
+            # strip the Option-key from the event
+            event = strip_option(event)
+    original(self, event)
+
+def recording(number, seed = 0):
+    """ a stream of events, like a recording """
+    r      = random.Random(seed)
+    stream = []
+    while len(stream) < number:
+        action = r.random()
+        if action < 0.6:
+            stream.extend([ FakeEvent(NSMouseMoved) ] * r.randint(5, 40))
+        elif action < 0.8:
+            stream.extend([ FakeEvent(NSScrollWheel) ] * r.randint(5, 30))
+        elif action < 0.9:
+            stream.extend([ FakeEvent(NSLeftMouseDown), FakeEvent(NSLeftMouseUp) ])
+        elif action < 0.98:
+            for c in r.sample(u'abcdefghijklmnopqrstuvwxyz ', r.randint(1, 10)):
+                stream.extend([ FakeEvent(NSKeyDown, 0, c), FakeEvent(NSKeyUp, 0, c) ])
+        else:
+            # Option-R (with Shift and/or Command, too)
+            flags = NSAlternateKeyMask | r.choice([0, 0, NSShiftKeyMask, NSCommandKeyMask, NSShiftKeyMask | NSCommandKeyMask])
+            stream.extend([
+                FakeEvent(NSFlagsChanged, flags),
+                FakeEvent(NSKeyDown, flags, u'r'),
+                FakeEvent(NSKeyUp, flags, u'r'),
+                FakeEvent(NSFlagsChanged, 0),
+            ])
+    return stream[:number]
+
+def main():
+    number  = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stream  = recording(number)
+    app     = FakeApp()
+    mailapp = FakeMailApp(app)
+    hook    = events.EventHook(strip_option)
+    hook.register(app)
+
+    # both hooks pass the same events on, and leave the toggle-key in the same state
+    passed, calls, toggle = ([], []), [], []
+    for i, checked in enumerate([None, events.EventHook(strip_option)]):
+        counting = CountingMailApp(CountingApp())
+        sendEvent = old_sendEvent
+        if checked is not None:
+            checked.register(counting.app)
+            sendEvent = checked.sendEvent
+        counts.update(event = 0, mailapp = 0, app = 0)
+        for event in stream:
+            event = CountingEvent(event._type, event._flags, event._characters)
+            sendEvent(counting, lambda self, event: passed[i].append(event._flags), event)
+        calls.append(dict(counts))
+        toggle.append(counting.app.toggle_key_active)
+    assert passed[0] == passed[1] and toggle[0] == toggle[1]
+
+    def original(self, event):
+        pass
+    def replay(sendEvent):
+        for event in stream:
+            sendEvent(mailapp, original, event)
+    t_old = bench(lambda: replay(old_sendEvent), repeat = 3)
+    t_new = bench(lambda: replay(hook.sendEvent), repeat = 3)
+    print "%d events: %.2f us per event, previously %.2f us (%.2fx)" % (
+        number, t_new / number * 1e6, t_old / number * 1e6, t_old / t_new)
+    for name, what in [('event', 'NSEvent-methods called'), ('mailapp', 'MailApp-attributes looked up'), ('app', 'App-attributes set')]:
+        print "%-30s %.3f per event, previously %.3f" % (what, float(calls[1][name]) / number, float(calls[0][name]) / number)
+
+if __name__ == '__main__':
+    main()
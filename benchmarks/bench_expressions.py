@@ -0,0 +1,57 @@
+"""
+Benchmark: evaluating simple template expressions (names and attribute
+chains like message.From.name) with eval() versus the fast path of
+EvalPseudoSandbox (see EvalPseudoSandbox.path), and rendering
+expression-heavy templates with and without the fast path.
+
+Usage: python benchmarks/bench_expressions.py
+"""
+from    common      import bench, usec, FakeMessage, ATTRIBUTIONS
+import  pyratemp
+
+class EvalSandbox(pyratemp.EvalPseudoSandbox):
+    """ the sandbox without the fast path for simple expressions """
+
+    def path(self, expr):
+        self.compile(expr)
+        return None
+
+    def eval(self, expr, locals):
+        # the previous EvalPseudoSandbox.eval
+        return eval(self.compile(expr), {"__builtins__": self.eval_allowed_globals}, locals)
+
+EXPRESSIONS = ['message', 'message.subject', 'message.From.name', 'message.sent.date', 'message.From.address.lower']
+
+TEMPLATES = {
+    'headers'   : ATTRIBUTIONS['headers'],
+    'paths'     : u'${message.From.name} <${message.From.email}> on ${message.sent.date} ${message.sent.time}: ${message.subject}\n' * 20,
+    'loop'      : u'''{% for r in message.recipients %}
+${r.name} <${r.email}> ${message.subject} ${message.sent.daylong}
+{% end %}
+''',
+}
+
+def main():
+    data = pyratemp.Scope(dict(message = FakeMessage(recipients = 20)))
+    sandbox, evalsandbox = pyratemp.EvalPseudoSandbox(), EvalSandbox()
+    print "%-28s %13s %13s %8s" % ('expression', 'eval()', 'fast path', 'speedup')
+    for expr in EXPRESSIONS:
+        assert sandbox.path(expr) is not None
+        assert sandbox.eval(expr, data) == evalsandbox.eval(expr, data)
+        t_eval   = bench(lambda: evalsandbox.eval(expr, data))
+        t_path   = bench(lambda: sandbox.eval(expr, data))
+        print "%-28s %s %s %7.2fx" % (expr, usec(t_eval), usec(t_path), t_eval / t_path)
+
+    print
+    print "%-28s %13s %13s %13s %13s" % ('template', 'Renderer', '+fast path', 'Compiled', '+fast path')
+    for name, source in sorted(TEMPLATES.items()):
+        times = []
+        for renderer in (pyratemp.Renderer, pyratemp.CompiledRenderer):
+            for eval_class in (EvalSandbox, pyratemp.EvalPseudoSandbox):
+                t = pyratemp.Template(source, renderer_class = renderer, eval_class = eval_class)
+                t(message = data['message'])
+                times.append(bench(lambda: t(message = data['message'])))
+        print "%-28s %s %s %s %s" % ((name,) + tuple([ usec(t) for t in times ]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark: templates which define and call several macros inside loops,
+with the tree-walking Renderer and the CompiledRenderer.
+
+Usage: python benchmarks/bench_macros.py
+"""
+from    common      import bench, usec, FakeMessage
+import  pyratemp
+
+TEMPLATES = {
+    # macros defined once, called for every recipient
+    'call in loop'      : u'''{% macro name %}${p.name}{% end %}
+{% macro address %}{{ name(p=p) }} <${p.email}>{% end %}
+{% for r in message.recipients %}
+To: {{ address(p=r) }}
+{% end %}
+''',
+    # several macros calling each other
+    'nested calls'      : u'''{% macro quote %}"${s}"{% end %}
+{% macro field %}${label}: {{ quote(s=value) }}{% end %}
+{% macro person %}{{ field(label="name", value=p.name) }}, {{ field(label="email", value=p.email) }}{% end %}
+{% for r in message.recipients %}
+{{ person(p=r) }}
+{% end %}
+''',
+    # macros (re)defined in every iteration of a loop
+    'define in loop'    : u'''{% for r in message.recipients %}
+  {% macro name %}${r.name}{% end %}
+  {% macro email %}${r.email}{% end %}
+{{ name() }} <{{ email() }}>
+{% end %}
+''',
+    # a macro used in a loop over a range
+    'many calls'        : u'''{% macro cell %}<td>${v}</td>{% end %}
+{% for i in range(n) %}
+{{ cell(v=i) }}{{ cell(v=i * 2) }}{{ cell(v=-i) }}
+{% end %}
+''',
+}
+
+def main():
+    data = dict(message = FakeMessage(recipients = 50), n = 200)
+    print "%-16s %13s %13s" % ('template', 'Renderer', 'Compiled')
+    for name, source in sorted(TEMPLATES.items()):
+        walking     = pyratemp.Template(source, renderer_class = pyratemp.Renderer)
+        compiled    = pyratemp.Template(source, renderer_class = pyratemp.CompiledRenderer)
+        assert walking(**data) == compiled(**data)
+        assert u''.join(compiled.iter_render(**data)) == compiled(**data)
+        print "%-16s %s %s" % (name, usec(bench(lambda: walking(**data))), usec(bench(lambda: compiled(**data))))
+
+if __name__ == '__main__':
+    main()
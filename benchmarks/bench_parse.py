@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: pyratemp.Parser on adversarial (unbalanced or otherwise broken)
+templates, versus the regexps used before by the parser.
+
+The previous regexps backtrack, which needs O(n^2) or even exponential time
+for some templates; since attributions are entered in the preferences, such
+a template could hang Mail. The parser now needs (nearly) linear time, so
+"us/char" should stay (nearly) constant when the template grows.
+
+The previous regexps are only run while they need less than LIMIT seconds.
+
+Usage: python benchmarks/bench_parse.py
+"""
+import  re, time
+from    common      import bench, usec
+import  pyratemp
+
+LIMIT = 0.5
+
+# the regexps of the previous pyratemp.Parser
+_s = re.escape(pyratemp.Parser._block_start) + "\s*"
+_e = "\s*" + re.escape(pyratemp.Parser._block_end)
+_strBlock = r"""
+                ^(?P<mEnd>[ \t]*)%send%s(?P<meIgnored>.*)\r?\n?   # multi-line end  (^   <!--(end)-->IGNORED_TEXT\n)
+                |
+                (?P<sEnd>)%send%s                               # single-line end (<!--(end)-->)
+                |
+                (?P<sSpace>[ \t]*)                              # single-line tag (no nesting)
+                %s(?P<sKeyw>\w+)[ \t]*(?P<sParam>.*?)%s
+                (?P<sContent>.*?)
+                (?=(?:%s.*?%s.*?)??%send%s)                     # (match until end or i.e. <!--(elif/else...)-->)
+                |
+                                                                # multi-line tag, nested by whitespace indentation
+                ^(?P<indent>[ \t]*)                             #   save indentation of start tag
+                %s(?P<mKeyw>\w+)\s*(?P<mParam>.*?)%s(?P<mIgnored>.*)\r?\n
+                (?P<mContent>(?:.*\n)*?)
+                (?=(?P=indent)%s(?:.|\s)*?%s)                   #   match indentation
+            """ % (_s, _e,
+                   _s, _e,
+                   _s, _e, _s, _e, _s, _e,
+                   _s, _e, _s, _e)
+_reBlock = re.compile(_strBlock, re.X|re.M)
+
+_strSubstitution = r"""
+                (
+                %s\s*(?P<sub>.*?)\s*(?P<end>%s|$)       #substitution
+                |
+                %s\s*(?P<escsub>.*?)\s*(?P<escend>%s|$) #escaped substitution
+                )
+            """ % (re.escape(pyratemp.Parser._sub_start),    re.escape(pyratemp.Parser._sub_end),
+                   re.escape(pyratemp.Parser._subesc_start), re.escape(pyratemp.Parser._subesc_end))
+_reSubstitution = re.compile(_strSubstitution, re.X|re.M)
+
+def previous(template):
+    """ find blocks and substitutions with the previous regexps """
+    list(_reBlock.finditer(template))
+    list(_reSubstitution.finditer(template))
+
+def parse(template):
+    try:
+        pyratemp.Parser().parse(template)
+    except pyratemp.TemplateSyntaxError:
+        pass
+
+# (name, template-generator, sizes)
+EXPONENTIAL = range(5, 55, 5) + [100, 1000, 10000]
+QUADRATIC   = [100, 200, 400, 800, 1600, 3200, 6400, 12800, 100000]
+CASES = [
+    ('unclosed tags in a line',     lambda n: u'{% if a %}x' * n,                   EXPONENTIAL),
+    ('else-tags in a line',         lambda n: u'{% if a %}' + u'{% else %}x' * n,   EXPONENTIAL),
+    ('long tag',                    lambda n: u'{% if a' + u' ' * n + u'%}',        QUADRATIC),
+    ('long substitution',           lambda n: u'{{x' + u' ' * n + u'y',             QUADRATIC),
+    ('indented tags without end',   lambda n: u''.join(u' ' * i + u'{% if a %}\n' for i in range(n)),
+                                                                                    QUADRATIC[:5]),
+]
+
+def main():
+    print "%-28s %6s %8s %13s %13s %9s" % ('template', 'n', 'length', 'previous', 'parser', 'us/char')
+    for name, template, sizes in CASES:
+        slow = False
+        for n in sizes:
+            t = template(n)
+            if slow:
+                old = "%13s" % 'skipped'
+            else:
+                t0 = time.time()
+                previous(t)
+                elapsed = time.time() - t0
+                slow = elapsed > LIMIT
+                old = usec(elapsed)
+            new = bench(lambda: parse(t), repeat = 3)
+            print "%-28s %6d %8d %s %s %9.3f" % (name, n, len(t), old, usec(new), new * 1e6 / len(t))
+
+if __name__ == '__main__':
+    main()
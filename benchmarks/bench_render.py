@@ -0,0 +1,35 @@
+"""
+Benchmark: rendering pyratemp templates with the tree-walking Renderer
+versus the CompiledRenderer.
+
+Usage: python benchmarks/bench_render.py
+"""
+from    common      import bench, usec, FakeMessage, ATTRIBUTIONS
+import  pyratemp
+
+TEMPLATES = dict(ATTRIBUTIONS)
+TEMPLATES['long loop'] = u'''{% for i in range(n) %}
+${i}: {{ i * 2 }} {% if i % 2 %}odd{% else %}even{% end %}
+{% end %}
+'''
+
+def main():
+    data = dict(message = FakeMessage(recipients = 10), n = 500)
+    print "%-12s %13s %13s %8s" % ('template', 'Renderer', 'Compiled', 'speedup')
+    for name, source in sorted(TEMPLATES.items()):
+        walking     = pyratemp.Template(source, renderer_class = pyratemp.Renderer)
+        compiled    = pyratemp.Template(source, renderer_class = pyratemp.CompiledRenderer)
+        assert walking(**data) == compiled(**data)
+        t_walking   = bench(lambda: walking(**data))
+        t_compiled  = bench(lambda: compiled(**data))
+        print "%-12s %s %s %7.2fx" % (name, usec(t_walking), usec(t_compiled), t_walking / t_compiled)
+
+    # one-shot use: build the template and render it once
+    source = ATTRIBUTIONS['headers']
+    print
+    print "%-12s %s %s" % ('build+render',
+        usec(bench(lambda: pyratemp.Template(source, renderer_class = pyratemp.Renderer)(**data))),
+        usec(bench(lambda: pyratemp.Template(source, renderer_class = pyratemp.CompiledRenderer)(**data))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: rendering one pyratemp.Template for many messages (i.e. previews
+over a selection, or bulk exports), in renders per second.
+
+  loop          template(message=...) for every message
+  render_many   template.render_many(...) in the calling thread
+  threads N     template.render_many(..., executor=ThreadPoolExecutor(N))
+
+The thread pools need concurrent.futures (the "futures" backport on Python 2)
+and are skipped without it. Rendering is pure Python, so threads only help
+if the data (i.e. the message-objects) release the GIL.
+
+Usage: python benchmarks/bench_render_many.py [messages]
+"""
+import  sys
+from    common      import bench, FakeMessage, ATTRIBUTIONS
+import  pyratemp
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+WORKERS = [2, 4]
+
+def main():
+    number   = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    datasets = [ { 'message': FakeMessage(recipients = i % 6) } for i in range(number) ]
+    pools    = []
+    if ThreadPoolExecutor is not None:
+        pools = [ ('threads %d' % n, ThreadPoolExecutor(n)) for n in WORKERS ]
+
+    print "%d messages, renders per second" % number
+    print "%-12s %12s %12s" % ('template', 'loop', 'render_many') + \
+          ''.join([ " %12s" % name for name, pool in pools ])
+    for name in sorted(ATTRIBUTIONS):
+        template = pyratemp.Template(ATTRIBUTIONS[name])
+        expected = [ template(**data) for data in datasets ]
+        assert list(template.render_many(datasets)) == expected
+        for _, pool in pools:
+            assert list(template.render_many(datasets, executor = pool)) == expected
+
+        loop = bench(lambda: [ template(**data) for data in datasets ], repeat = 3)
+        many = bench(lambda: list(template.render_many(datasets)), repeat = 3)
+        line = "%-12s %12.0f %12.0f" % (name, number / loop, number / many)
+        for _, pool in pools:
+            t = bench(lambda: list(template.render_many(datasets, executor = pool)), repeat = 3)
+            line += " %12.0f" % (number / t)
+        print line
+    if not pools:
+        print "\n(thread pools skipped: concurrent.futures is not installed)"
+    for _, pool in pools:
+        pool.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark: utils.SimpleTemplate.substitute, tokenized once per template,
+versus the previous implementation (re.sub and getattr for every call).
+
+utils imports objc, so this needs PyObjC (but not Mail.app).
+
+Usage: python benchmarks/bench_simpletemplate.py
+"""
+import  re
+from    common      import bench, usec, FakeMessage
+from    utils       import SimpleTemplate
+
+class OldSimpleTemplate:
+    """ the previous utils.SimpleTemplate """
+
+    def __init__(self, template):
+        self.template = template
+
+    def _substitute_param(self, param, params):
+        tokens  = param.split('.')
+        node    = params.get(tokens.pop(0))
+        while node and tokens:
+            node = getattr(node, tokens.pop(0), None)
+        if node == None:
+            return '${%s}' % param
+        return unicode(node)
+
+    def substitute(self, params):
+        return re.sub(r'\$\{(.*?)\}',  lambda p: self._substitute_param(p.group(1), params), self.template)
+
+TEMPLATES = {
+    'no params'     : u'-------- Original Message --------',
+    'simple'        : u'On ${message.sent.date}, ${message.From.name} wrote:',
+    'headers'       : u'From: ${message.From.name} <${message.From.email}>\nSent: ${message.sent}\n'
+                      u'To: ${message.to}\nSubject: ${message.subject}\n',
+    'unresolved'    : u'${message.From.nickname} ${missing} ${message.sent.date} ${}',
+    'many'          : u'${message.From.name} <${message.From.email}>, ' * 20,
+}
+
+def main():
+    params = dict(message = FakeMessage())
+    print "%-12s %13s %13s %8s" % ('template', 'old', 'tokenized', 'speedup')
+    for name, template in sorted(TEMPLATES.items()):
+        old, new = OldSimpleTemplate(template), SimpleTemplate(template)
+        assert old.substitute(params) == new.substitute(params)
+        t_old = bench(lambda: old.substitute(params))
+        t_new = bench(lambda: new.substitute(params))
+        print "%-12s %s %s %7.2fx" % (name, usec(t_old), usec(t_new), t_old / t_new)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Benchmark: rendering attribution templates through the engine selection of
+templating.TemplateSelector, versus pyratemp.
+
+  new Template      pyratemp.Template(string)(...) for every rendering
+  Template          a pyratemp.Template, created once
+  selector          TemplateSelector().render(string, ...), which uses the
+                    cheapest engine (shown in the last column)
+
+Usage: python benchmarks/bench_templating.py
+"""
+from    common      import bench, usec, FakeMessage, ATTRIBUTIONS
+import  pyratemp, templating
+
+TEMPLATES = dict(ATTRIBUTIONS)
+TEMPLATES.update({
+    'text only' : u'-------- Original Message --------',
+})
+
+def main():
+    data     = dict(message = FakeMessage())
+    selector = templating.TemplateSelector()
+    print "%-12s %13s %13s %13s  %s" % ('template', 'new Template', 'Template', 'selector', 'engine')
+    for name, source in sorted(TEMPLATES.items()):
+        template = pyratemp.Template(source)
+        assert selector.render(source, **data) == template(**data)
+        t_new = bench(lambda: pyratemp.Template(source)(**data))
+        t_tmp = bench(lambda: template(**data))
+        t_sel = bench(lambda: selector.render(source, **data))
+        print "%-12s %s %s %s  %s" % (name, usec(t_new), usec(t_tmp), usec(t_sel), selector.engine(source))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark and check of the conversion of NSDate timestamps (seconds since
+1970) to datetime, as done by attributionclasses.QFDateTime:
+
+  previous      format as text in the local timezone (like
+                NSDate.descriptionWithCalendarFormat_timeZone_locale_),
+                then parse it with datetime.strptime
+  single        dateformat.datetime_from_timestamp, per timestamp
+  batch         dateformat.datetimes_from_timestamps, for the whole list
+
+The results have to be the same as the previous conversion (which has no
+fractions of seconds), and timestamps converted to UTC have to give the
+same timestamps again, like the ones converted to LOCAL (with the offset
+of the moment itself, even when the clock is turned back). The exit-status is 1 if any result
+differs. In Mail, the previous conversion also needed an extra PyObjC
+call, which isn't included here.
+
+Usage: python benchmarks/bench_timestamps.py [timestamps] [seed]
+"""
+import  calendar, random, sys, time
+from    datetime    import datetime
+from    common      import bench, usec
+import  dateformat
+
+def old_nsdate_to_datetime(seconds):
+    """ the previous QFDateTime.nsdate_to_datetime, with a timestamp """
+    description = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seconds))
+    return datetime.strptime(description, "%Y-%m-%d %H:%M:%S")
+
+def main():
+    number      = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    r           = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    timestamps  = [ r.uniform(0, 2 ** 31) for i in range(number) ]
+    failures    = 0
+    local       = dateformat.datetimes_from_timestamps(timestamps)
+    utc         = dateformat.datetimes_from_timestamps(timestamps, dateformat.UTC)
+    aware       = dateformat.datetimes_from_timestamps(timestamps, dateformat.LOCAL)
+    for seconds, new, new_utc, new_aware in zip(timestamps, local, utc, aware):
+        old = old_nsdate_to_datetime(seconds)
+        if new.replace(microsecond = 0) != old or new != dateformat.datetime_from_timestamp(seconds):
+            failures += 1
+            print "DIFFERENT: %r -> %s, previously %s" % (seconds, new, old)
+        if abs(calendar.timegm(new_utc.utctimetuple()) + new_utc.microsecond / 1e6 - seconds) > 1e-6:
+            failures += 1
+            print "DIFFERENT (UTC): %r -> %s, local %s" % (seconds, new_utc, new)
+        if new_aware != new_utc or new_aware.replace(tzinfo = None) != new:
+            failures += 1
+            print "DIFFERENT (LOCAL): %r -> %s, local %s" % (seconds, new_aware, new)
+    print "%d timestamps: %s" % (number, failures and "%d failures" % failures or "ok")
+
+    print
+    t_old   = bench(lambda: [ old_nsdate_to_datetime(seconds) for seconds in timestamps ], repeat = 3)
+    t_new   = bench(lambda: [ dateformat.datetime_from_timestamp(seconds) for seconds in timestamps ], repeat = 3)
+    t_batch = bench(lambda: dateformat.datetimes_from_timestamps(timestamps), repeat = 3)
+    print "per timestamp: previous %s, single %s (%.1fx), batch %s (%.1fx)" % (
+        usec(t_old / number), usec(t_new / number), t_old / t_new, usec(t_batch / number), t_old / t_batch)
+    sys.exit(failures and 1 or 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Helpers shared by the benchmark scripts.
+
+The benchmarks only use the pure-Python parts of MailTrack, so they run
+outside of Mail.app (and without PyObjC, unless stated otherwise).
+"""
+import  os, sys, timeit
+
+# import the modules directly, since the package itself needs Mail.app
+MAILTRACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'mailtrack')
+sys.path.insert(0, os.path.normpath(MAILTRACK))
+
+def bench(func, number = None, repeat = 5):
+    """ return the best time (in seconds) of a single call to func() """
+    timer = timeit.Timer(func)
+    if number is None:
+        # calibrate: aim for ~0.1 seconds per measurement
+        number = 1
+        while timer.timeit(number) < 0.1:
+            number *= 10
+    return min(timer.repeat(repeat, number)) / number
+
+def usec(seconds):
+    return "%10.2f us" % (seconds * 1e6)
+
+# message-like objects, shaped like attributionclasses.QFMessage
+class FakeAddressee:
+
+    def __init__(self, name, email):
+        self.name       = name
+        self.email      = email
+        self.address    = u'%s <%s>' % (name, email)
+
+    def __unicode__(self):
+        return self.address
+
+class FakeAddresseeList:
+
+    def __init__(self, addressees):
+        self.addressees = addressees
+
+    def __len__(self):
+        return len(self.addressees)
+
+    def __iter__(self):
+        return iter(self.addressees)
+
+    def join(self, separator = ", ", field = 'address'):
+        return separator.join([ unicode(getattr(a, field)) for a in self.addressees ])
+
+    def __unicode__(self):
+        return self.join(", ")
+
+class FakeDateTime(str):
+
+    def __new__(cls, value):
+        self            = super(FakeDateTime, cls).__new__(cls, value)
+        self.date       = value[:15]
+        self.time       = value[16:]
+        self.year       = value[11:15]
+        self.daylong    = 'Tuesday'
+        self.monthlong  = 'October'
+        return self
+
+class FakeMessage:
+
+    def __init__(self, recipients = 3):
+        people          = [ FakeAddressee(u'Person %d' % i, u'person%d@example.com' % i) for i in range(recipients) ]
+        self.From       = FakeAddressee(u'J\xf6rg "Jay" O\'Neil', u'jay@example.com')
+        self.sender     = self.From.address
+        self.to         = FakeAddresseeList(people[:1])
+        self.subject    = u'Re: <quarterly> numbers & plans'
+        self.sent       = FakeDateTime('Tue Oct 14 2014 09:41:00')
+        self.received   = FakeDateTime('Tue Oct 14 2014 09:42:13')
+        self.recipients = FakeAddresseeList(people)
+
+# attribution templates, as users write them in the preferences
+ATTRIBUTIONS = {
+    'simple'    : u'On ${message.sent.date}, ${message.From.name} wrote:',
+    'headers'   : u'''-------- Original Message --------
+From: ${message.From}
+Date: ${message.sent.date} ${message.sent.time}
+Subject: ${message.subject}
+To: ${message.to}
+''',
+    'recipients': u'''{% for r in message.recipients %}
+  ${r.name} <${r.email}>
+{% else %}
+  (no recipients)
+{% end %}
+{% if len(message.recipients) > 2 %}
+(and ${len(message.recipients) - 2} more)
+{% end %}
+''',
+    'macros'    : u'''{% macro person %}${p.name} <${p.email}>{% end %}
+From: {{ person(p=message.From) }}
+{% for r in message.recipients %}
+To: {{ person(p=r) }}
+{% end %}
+''',
+}
@@ -0,0 +1,106 @@
+"""
+Fuzz test and benchmark of entities.htmlunescape (as utils.htmlunescape),
+compared with the previous implementation on random HTML-like text:
+
+  - with the HTML 4 entities of htmlentitydefs, the results have to be
+    identical (except for &lang; and &rang;, which are different
+    characters in HTML5, and numbers too large for unichr(), which made
+    the previous implementation raise an OverflowError)
+  - with all HTML5 entities, they have to be identical to the previous
+    implementation using the HTML5 table
+  - iter_htmlunescape, with the text split into random chunks, has to
+    yield the same text
+
+The exit-status is 1 if any result differs.
+
+Usage: python benchmarks/fuzz_htmlunescape.py [iterations] [seed]
+"""
+import  random, re, sys, htmlentitydefs
+from    common      import bench, usec
+import  entities
+
+def old_htmlunescape(text, name2char = None):
+    """ the previous utils.htmlunescape (with an optional other entity-table) """
+    def fixup(m):
+        text = m.group(0)
+        if text[:2] == "&#":
+            # character reference
+            try:
+                if text[:3] == "&#x":
+                    return unichr(int(text[3:-1], 16))
+                else:
+                    return unichr(int(text[2:-1]))
+            except ValueError:
+                pass
+        else:
+            # named entity
+            try:
+                if name2char is None:
+                    text = unichr(htmlentitydefs.name2codepoint[text[1:-1]])
+                else:
+                    text = name2char[text[1:-1]]
+            except KeyError:
+                pass
+        return text # leave as is
+    return re.sub("&#?\w+;", fixup, text)
+
+HTML4   = sorted(set(htmlentitydefs.name2codepoint) - set(['lang', 'rang']))
+HTML5   = sorted(entities.html5)
+PIECES  = [u'&', u'#', u'x', u'X', u';', u' ', u'a', u'Z', u'0', u'9', u'_', u'<b>', u'\n', u'\xe4', u'\u2026',
+           u'&#', u'&#x', u'&amp', u'&#65', u'&#x1F600', u'&#1114112;', u'&#xD800;', u'&;', u'&&;']
+
+def corpus(r, names, length):
+    """ random text with references, entities, and fragments of them """
+    text = []
+    for i in range(length):
+        c = r.random()
+        if c < 0.3:
+            text.append(u'&%s;' % r.choice(names))
+        elif c < 0.4:
+            text.append(u'&#%d;' % r.choice([r.randrange(128), r.randrange(0x110000), r.randrange(10 ** 9)]))
+        elif c < 0.5:
+            text.append(u'&#x%x;' % r.randrange(0x110000))
+        else:
+            text.append(r.choice(PIECES))
+    return u''.join(text)
+
+def chunked(r, text):
+    """ split text at random positions """
+    cuts = sorted(r.sample(xrange(len(text) + 1), min(len(text) + 1, r.randint(0, 8))))
+    return [ text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)]) ]
+
+def main():
+    iterations  = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    r           = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    failures    = 0
+    for i in range(iterations):
+        html5 = r.random() < 0.5
+        text  = corpus(r, html5 and HTML5 or HTML4, r.randint(0, 40))
+        if r.random() < 0.2:
+            text = text.encode('ascii', 'ignore')
+        new = entities.htmlunescape(text)
+        try:
+            old = old_htmlunescape(text, html5 and entities.html5 or None)
+        except OverflowError:
+            old = None
+        if old is not None and (old != new or type(old) != type(new)):
+            failures += 1
+            print "DIFFERENT: %r -> %r, previously %r" % (text, new, old)
+        streamed = u''.join(entities.iter_htmlunescape(chunked(r, text)))
+        if streamed != new:
+            failures += 1
+            print "DIFFERENT (chunked): %r -> %r, not %r" % (text, streamed, new)
+    print "%d texts: %s" % (iterations, failures and "%d failures" % failures or "ok")
+
+    print
+    print "%-16s %13s %13s %8s" % ('text', 'previous', 'new', 'speedup')
+    message = u'Quoted text &gt; with some &lt;markup&gt; &amp; an entity per line&hellip;\n' * 200
+    for name, text in [('no entities', u'Plain text of a quoted message, without any markup.\n' * 200),
+                       ('entities', message)]:
+        t_old = bench(lambda: old_htmlunescape(text))
+        t_new = bench(lambda: entities.htmlunescape(text))
+        print "%-16s %s %s %7.2fx" % (name, usec(t_old), usec(t_new), t_old / t_new)
+    sys.exit(failures and 1 or 0)
+
+if __name__ == '__main__':
+    main()
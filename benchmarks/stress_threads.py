@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Stress test: render the same pyratemp.Template from many threads at the same
+time, and check every output against the serial result.
+
+The templates use exists(), default() and setvar() (which need the
+data-namespace of the current rendering) in loops and macros, and are
+rendered with different data in every thread; each template is rendered
+once serially before, so the threads use the compiled renderer, and once
+in the threads, so they also race to compile it.
+
+Usage: python benchmarks/stress_threads.py [threads [renderings-per-thread]]
+"""
+import  sys, threading
+from    common      import FakeMessage, ATTRIBUTIONS
+import  pyratemp
+
+TEMPLATES = dict(ATTRIBUTIONS)
+TEMPLATES.update({
+    'sandbox'   : u'''{{ setvar("count", "len(message.recipients)") }}
+{% for r in message.recipients %}
+{{ setvar("last", "r.name") }}
+${r.name}${default("suffix", "")}{% if exists("first") %} (after ${first}){% end %}
+{% end %}
+${count} recipients, last: ${default("last", "nobody")}
+''',
+    'nested'    : u'''{% macro line %}${default("prefix", "-")} ${p.name}{% end %}
+{% for r in message.recipients %}
+{{ line(p=r) }}:
+  {% for c in r.name %}
+    {{ setvar("char", "c.upper()") }}
+${default("char", "?")}
+  {% end %}
+{% end %}
+''',
+})
+
+def data(i):
+    """ different data for every rendering """
+    kwargs = { 'message': FakeMessage(recipients = i % 5) }
+    if i % 2:
+        kwargs['first'] = u'first %d' % i
+    if i % 3:
+        kwargs['suffix'] = u' #%d' % i
+        kwargs['prefix'] = u'*' * (i % 4)
+    return kwargs
+
+def stress(name, tmpl, threads, number, precompile):
+    """ render tmpl from threads, return the number of wrong outputs """
+    template = pyratemp.Template(tmpl)
+    if precompile:
+        for i in range(2):
+            template(**data(i))
+    expected = [ template(**data(i)) for i in range(number) ]
+    # create a new template, so the threads also race to compile it
+    if not precompile:
+        template = pyratemp.Template(tmpl)
+    errors  = []
+    start   = threading.Event()
+
+    def worker(offset):
+        start.wait()
+        for k in range(number):
+            i = (k + offset) % number
+            try:
+                if i % 2:
+                    result = u''.join(template.iter_render(**data(i)))
+                else:
+                    result = template(**data(i))
+            except pyratemp.TemplateException, err:
+                result = err
+            if result != expected[i]:
+                errors.append((i, result))
+
+    workers = [ threading.Thread(target = worker, args = (t,)) for t in range(threads) ]
+    for w in workers:
+        w.start()
+    start.set()
+    for w in workers:
+        w.join()
+    for i, result in errors[:3]:
+        print "  %s: rendering %d\n    expected %r\n    got      %r" % (name, i, expected[i], result)
+    return len(errors)
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    number  = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sys.setcheckinterval(1)         # switch threads as often as possible
+    failed = 0
+    for name in sorted(TEMPLATES):
+        for precompile in (False, True):
+            errors = stress(name, TEMPLATES[name], threads, number, precompile)
+            print "%-12s %-12s %3d threads x %4d renderings: %s" % (name,
+                    precompile and 'compiled' or 'compiling', threads, number,
+                    errors and '%d WRONG' % errors or 'ok')
+            failed += errors
+    sys.exit(failed and 1 or 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for pyratemp, with results which can be compared between
+two runs (i.e. before and after a change).
+
+Times, for the attribution templates and some synthetic stress templates:
+
+  parse/<template>          Parser.parse
+  render/<template>         Renderer.render (walking the parse-tree)
+  compiled/<template>       CompiledRenderer.render (already compiled)
+  compile/<template>        EvalPseudoSandbox.compile of all expressions
+                            (without any compile-cache)
+  eval/<template>           EvalPseudoSandbox.eval of all expressions, which
+                            can be evaluated outside of loops/macros
+  escape/<format>           escape of typical attribution values
+
+It only needs pyratemp (no PyObjC or Mail.app), so it runs headless.
+
+Usage:
+  python benchmarks/suite.py [-o results.json] [-k filter] [--quick]
+  python benchmarks/suite.py --compare before.json [after.json]
+
+With --compare, the results of after.json (or of a new run) are compared
+with before.json; the exit-status is 1 if anything is slower by more than
+--threshold percent.
+"""
+import  json, optparse, platform, sys, time
+from    common      import bench, usec, FakeMessage, ATTRIBUTIONS
+import  pyratemp
+
+#-----------------------------------------
+# templates
+
+def nested(depth):
+    """ 'if'- and 'for'-blocks nested depth times """
+    lines = []
+    for d in range(depth):
+        if d % 2:
+            lines.append(u' ' * d + u'{%% for i%d in range(2) %%}' % d)
+        else:
+            lines.append(u' ' * d + u'{%% if n > %d %%}' % d)
+    lines.append(u'${n}: ' + u''.join([ u'${i%d}' % d for d in range(1, depth, 2) ]))
+    for d in reversed(range(depth)):
+        lines.append(u' ' * d + u'{% end %}')
+    return u'\n'.join(lines) + u'\n'
+
+TEMPLATES = dict(ATTRIBUTIONS)
+TEMPLATES.update({
+    'deep nesting'  : nested(16),
+    'long loop'     : u'''{% for i in range(n * 20) %}
+${i}: {{ i * 2 }} {% if i % 2 %}odd{% else %}even{% end %}
+{% end %}
+''',
+    'many subs'     : u'${message.From.name} <${message.From.email}>: {{ message.subject }}, ${n}\n' * 200,
+})
+
+DATA = dict(message = FakeMessage(recipients = 10), n = 50)
+
+VALUES = [
+    u'Tue Oct 14 2014',
+    u'J\xf6rg "Jay" O\'Neil <jay@example.com>',
+    u'Re: <quarterly> numbers & plans',
+    u'> quoted line of a longer message body, with 50% of $costs & {braces} ' * 8,
+]
+
+#-----------------------------------------
+# benchmarks
+
+def expressions(parsetree):
+    """ all expressions of a parse-tree """
+    exprs = []
+    for elem in parsetree:
+        if elem[0] in ("sub", "if", "elif"):
+            exprs.append(elem[1])
+        elif elem[0] == "esc":
+            exprs.append(elem[2])
+        elif elem[0] == "for":
+            exprs.append(elem[2])
+        if elem[0] in ("for", "if", "elif", "else", "macro"):
+            exprs.extend(expressions(elem[-1]))
+    return exprs
+
+def benchmarks():
+    """ yield (name, function) of all benchmarks """
+    for name, source in sorted(TEMPLATES.items()):
+        sandbox     = pyratemp.EvalPseudoSandbox()
+        parsetree   = pyratemp.Parser(testexpr = sandbox.compile).parse(source)
+        parsetree   = pyratemp.Optimizer().optimize(parsetree)
+        walker      = pyratemp.Renderer(sandbox.eval, pyratemp.escape)
+        compiled    = pyratemp.CompiledRenderer(sandbox.eval, pyratemp.escape)
+        expected    = walker.render(parsetree, pyratemp.Scope(DATA))
+        for i in range(compiled.compile_threshold + 1):
+            assert compiled.render(parsetree, pyratemp.Scope(DATA)) == expected
+
+        # a sandbox without any compile-cache
+        cold = pyratemp.EvalPseudoSandbox()
+        cold.shared_cache = pyratemp.CompileCache(0)
+        def compile_all(exprs = expressions(parsetree)):
+            cold._compile_cache.clear()
+            for expr in exprs:
+                cold.compile(expr)
+
+        # (expressions using loop-variables or macro-arguments fail here)
+        exprs = []
+        for expr in expressions(parsetree):
+            try:
+                sandbox.eval(expr, pyratemp.Scope(DATA))
+                exprs.append(expr)
+            except Exception:
+                pass
+        def eval_all(exprs = exprs):
+            data = pyratemp.Scope(DATA)
+            for expr in exprs:
+                sandbox.eval(expr, data)
+
+        yield ('parse/' + name,     lambda source = source: pyratemp.Parser().parse(source))
+        yield ('render/' + name,    lambda r = walker, p = parsetree: r.render(p, pyratemp.Scope(DATA)))
+        yield ('compiled/' + name,  lambda r = compiled, p = parsetree: r.render(p, pyratemp.Scope(DATA)))
+        yield ('compile/' + name,   compile_all)
+        yield ('eval/' + name,      eval_all)
+
+    for format in sorted(pyratemp.ESCAPE_SUPPORTED):
+        def escape_all(format = pyratemp.ESCAPE_SUPPORTED[format]):
+            for value in VALUES:
+                pyratemp.escape(value, format)
+        yield ('escape/' + format, escape_all)
+
+def run(pattern = None, repeat = 5):
+    """ run the benchmarks, return {name: seconds} """
+    results = {}
+    for name, func in benchmarks():
+        if pattern and pattern not in name:
+            continue
+        results[name] = bench(func, repeat = repeat)
+        print >>sys.stderr, "%-32s %s" % (name, usec(results[name]))
+    return results
+
+#-----------------------------------------
+# results
+
+def save(results, filename):
+    document = {
+        'python':       sys.version,
+        'platform':     platform.platform(),
+        'pyratemp':     pyratemp.__version__,
+        'date':         time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'unit':         'seconds',
+        'results':      results,
+    }
+    f = open(filename, 'w')
+    try:
+        json.dump(document, f, indent = 1, sort_keys = True)
+    finally:
+        f.close()
+
+def load(filename):
+    f = open(filename)
+    try:
+        return json.load(f)['results']
+    finally:
+        f.close()
+
+def compare(before, after, threshold):
+    """ print the ratios, return the number of regressions """
+    regressions = 0
+    print "%-32s %13s %13s %8s" % ('benchmark', 'before', 'after', 'ratio')
+    for name in sorted(set(before) & set(after)):
+        ratio = after[name] / before[name]
+        slower = ratio > 1 + threshold / 100.0
+        regressions += slower
+        print "%-32s %s %s %7.2fx%s" % (name, usec(before[name]), usec(after[name]), ratio,
+                                        slower and '  SLOWER' or '')
+    missing = len(set(before) ^ set(after))
+    if missing:
+        print "(%d benchmarks only in one of the results)" % missing
+    return regressions
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [-o results.json] [--compare before.json [after.json]]")
+    parser.add_option('-o', '--output',     help = "write the results to this JSON-file")
+    parser.add_option('-k', '--filter',     help = "only run benchmarks containing this string")
+    parser.add_option('--quick',            action = 'store_true', help = "fewer repetitions")
+    parser.add_option('--compare',          metavar = 'BEFORE', help = "compare with the results in this JSON-file")
+    parser.add_option('--threshold',        type = 'float', default = 10.0,
+                                            help = "percent slower counted as regression [%default]")
+    options, args = parser.parse_args()
+    if len(args) > 1 or (args and not options.compare):
+        parser.error("too many arguments")
+
+    if args:
+        results = load(args[0])
+    else:
+        results = run(options.filter, repeat = options.quick and 2 or 5)
+    if options.output:
+        save(results, options.output)
+    if options.compare:
+        sys.exit(compare(load(options.compare), results, options.threshold) and 1 or 0)
+
+if __name__ == '__main__':
+    main()
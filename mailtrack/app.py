@@ -1,6 +1,7 @@
 from    AppKit                  import NSUserDefaults, NSBundle, NSApplication, NSRunAlertPanel
 from    Foundation              import NSLog
 from    mailtrack.menu           import Menu
+from    mailtrack.events         import DEFAULT_SHORTCUTS
 from    objc                    import Category, lookUpClass
 from    logger                  import logger
 import  os, re
@@ -24,7 +25,8 @@ class App(object):
         self.prefs.registerDefaults_(dict(
             MailTrackOption        = True,
             MailTrackEnableDebugging = False,
-            MailTrackDisabled = False
+            MailTrackDisabled = False,
+            MailTrackToggleShortcuts = DEFAULT_SHORTCUTS
         ))
 
         # set log level
@@ -81,6 +83,12 @@ If you run into any problems with regards to replying or forwarding mail, consid
     def is_active(self, value):
         self.prefs.bool["MailTrackDisabled"] = value
 
+    # shortcuts for which the 'toggle key' is stripped: the preference as
+    # is (it is checked by events.EventHook.register)
+    @property
+    def toggle_shortcuts(self):
+        return self.prefs.object['MailTrackToggleShortcuts']
+
     # debugging
     @property
     def is_debugging(self):
@@ -1,7 +1,7 @@
 from    AppKit      import NSDate, NSLocale, NSDateFormatter
 from    Foundation  import NSLog
-from    datetime    import datetime
-import  email.utils, re
+import  email.utils
+import  dateformat
 
 class QFMessage:
     """ wraps a message """
@@ -81,85 +81,98 @@ class QFAddressee:
     def __repr__(self):
         return self.__unicode__()
 
+# an NSDateFormatter for a format and locale
+def cocoa_formatter(fmt, locale):
+    formatter = NSDateFormatter.alloc().init()
+    formatter.setDateFormat_(fmt)
+    formatter.setLocale_(NSLocale.alloc().initWithLocaleIdentifier_(locale))
+    return formatter
+
+# a date/time attribute of QFDateTime, formatted on first access and then
+# cached in the instance (which takes precedence over this descriptor)
+class QFDateTimeAttribute(object):
+
+    def __init__(self, name, format):
+        self.name   = name
+        self.format = format
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.format(self.format)
+        setattr(instance, self.name, value)
+        return value
+
 class QFDateTime(str):
     """ wraps a datetime object """
-    formatter           = NSDateFormatter.alloc().init()
     default_format      = "EEE MMM dd yyyy HH:mm:ss"
-    STRFTIME_TO_UNICODE = {
-        '%Y'    : 'yyyy',
-        '%m'    : 'MM',
-        '%d'    : 'dd',
-        '%H'    : 'HH',
-        '%I'    : 'hh',
-        '%p'    : 'a',
-        '%M'    : 'mm',
-        '%S'    : 'ss',
-        '%U'    : 'w',
-        '%b'    : 'MMM',
-        '%B'    : 'MMMM',
-        '%a'    : 'E',
-        '%A'    : 'EEEE',
-        '%x'    : 'EEE MMM dd yyyy',
-        '%X'    : 'HH:mm:ss',
-        '%z'    : 'Z',
-    }
+    # (the locale of a new NSDateFormatter)
+    default_locale      = NSLocale.currentLocale().localeIdentifier()
+    STRFTIME_TO_UNICODE = dateformat.STRFTIME_TO_UNICODE
+
+    # NSDateFormatters by (format, locale), for locales and formats which
+    # dateformat doesn't support; they are not changed once set up
+    cocoa_formatters    = dateformat.FormatterCache(cocoa_formatter, maxsize = 50)
+
+    # date/time attributes
+    year        = QFDateTimeAttribute('year',       "yyyy")
+    month       = QFDateTimeAttribute('month',      "MM")
+    day         = QFDateTimeAttribute('day',        "dd")
+    hour        = QFDateTimeAttribute('hour',       "HH")
+    hour12      = QFDateTimeAttribute('hour12',     "hh")
+    ampm        = QFDateTimeAttribute('ampm',       "a")
+    minute      = QFDateTimeAttribute('minute',     "mm")
+    second      = QFDateTimeAttribute('second',     "ss")
+    weeknumber  = QFDateTimeAttribute('weeknumber', "w")
+    monthshort  = QFDateTimeAttribute('monthshort', "MMM")
+    monthlong   = QFDateTimeAttribute('monthlong',  "MMMM")
+    dayshort    = QFDateTimeAttribute('dayshort',   "E")
+    daylong     = QFDateTimeAttribute('daylong',    "EEEE")
+    date        = QFDateTimeAttribute('date',       "EEE MMM dd yyyy")
+    time        = QFDateTimeAttribute('time',       "HH:mm:ss")
+    timezone    = QFDateTimeAttribute('timezone',   "Z")
 
     def __new__(cls, nsdate):
-        cls.formatter.setDateFormat_(cls.default_format)
+        # (in the local timezone, with the offset of the date itself)
+        dt              = cls.nsdate_to_datetime(nsdate, dateformat.LOCAL)
         self            = super(QFDateTime, cls).__new__(
             cls,
-            cls.formatter.stringFromDate_(nsdate).encode('utf-8')
+            cls.format_date(nsdate, dt, cls.default_format, cls.default_locale)
         )
         self.nsdate     = nsdate
-
-        # set date/time attributes
-        attributes      = dict(
-            year        = "yyyy",
-            month       = "MM",
-            day         = "dd",
-            hour        = "HH",
-            hour12      = "hh",
-            ampm        = "a",
-            minute      = "mm",
-            second      = "ss",
-            weeknumber  = "w",
-            monthshort  = "MMM",
-            monthlong   = "MMMM",
-            dayshort    = "E",
-            daylong     = "EEEE",
-            date        = "EEE MMM dd yyyy",
-            time        = "HH:mm:ss",
-            timezone    = "Z",
-        )
-
-        for attribute, format in attributes.items():
-            self.formatter.setDateFormat_(format)
-            setattr(self, attribute, self.formatter.stringFromDate_(nsdate).encode('utf-8'))
-
+        self.datetime   = dt
         return self
 
+    @classmethod
+    def format_date(cls, nsdate, dt, fmt, locale):
+        # dateformat formats the datetime, NSDateFormatter the NSDate (for
+        # locales and patterns dateformat doesn't support)
+        formatter = dateformat.formatters.get(fmt, locale)
+        if formatter is not None:
+            return formatter.format(dt).encode('utf-8')
+        return cls.cocoa_formatters.get(fmt, locale).stringFromDate_(nsdate).encode('utf-8')
+
     def strftime_to_unicode(self, fmt):
         """ convert strftime formatting character to Unicode formatting string """
-        return re.sub(
-            r'(%[a-zA-Z])',
-            lambda m: self.STRFTIME_TO_UNICODE.get(m.group(1), m.group(1)),
-            fmt
-        )
+        return dateformat.strftime_to_unicode(fmt)
 
     def strftime(self, fmt, locale = None, timezone = None):
         return self.format(self.strftime_to_unicode(fmt), locale, timezone = None)
 
     def format(self, fmt, locale = None, timezone = None):
-        self.formatter.setDateFormat_(fmt)
-        if locale:
-            self.formatter.setLocale_(NSLocale.alloc().initWithLocaleIdentifier_(locale))
-        return self.formatter.stringFromDate_(self.nsdate).encode('utf-8')
+        # (the locale is only used for this call)
+        return self.format_date(self.nsdate, self.datetime, fmt, locale or self.default_locale)
 
     def locale(self, locale):
         return self.format(self.default_format, locale)
 
     @classmethod
-    def nsdate_to_datetime(cls, nsdate):
-        # convert NSDate to datetime (XXX: always converts to local timezone)
-        description = nsdate.descriptionWithCalendarFormat_timeZone_locale_("%Y-%m-%d %H:%M:%S", None, None)
-        return datetime.strptime(description, "%Y-%m-%d %H:%M:%S")
+    def nsdate_to_datetime(cls, nsdate, tz = None):
+        # convert NSDate to datetime: naive in the local timezone, or in
+        # the timezone tz (i.e. dateformat.UTC or dateformat.LOCAL)
+        return dateformat.datetime_from_timestamp(nsdate.timeIntervalSince1970(), tz)
+
+    @classmethod
+    def nsdates_to_datetimes(cls, nsdates, tz = None):
+        # convert a list of NSDates (i.e. of selected messages) at once
+        return dateformat.datetimes_from_timestamps([ nsdate.timeIntervalSince1970() for nsdate in nsdates ], tz)
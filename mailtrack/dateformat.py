@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+import  calendar, collections, math, re, threading, time
+from    datetime    import date, datetime, timedelta, tzinfo
+from    operator    import attrgetter
+
+# Date formatting with Unicode date patterns (LDML, as used by
+# NSDateFormatter), in Python: a pattern is compiled once per locale into a
+# DateFormatter, which formats datetime values. Formatters are never
+# changed after they are compiled, so they can be shared by threads.
+#
+# Only the names of a few languages are known (see NAMES), and only the
+# fields and letter counts in _COUNTS; find_locale() returns None for other
+# locales (or locales with keywords, like '@calendar=...'), and formatters
+# returns None for other patterns, so these can be formatted by
+# NSDateFormatter instead (see attributionclasses.QFDateTime). Naive datetime values are
+# taken to be in the local time zone, like NSDate's are by NSDateFormatter,
+# but their offset from UTC is ambiguous when the clock is turned back;
+# datetime_from_timestamp(seconds, LOCAL) gives a local datetime with the
+# offset of the moment itself.
+
+# names of months (January first), days (Monday first, like
+# datetime.weekday()), AM/PM, eras (BC, AD, abbreviated) and quarters, in
+# the form used in dates (not the stand-alone form), as in CLDR
+Names = collections.namedtuple('Names', 'months monthsshort monthsnarrow days daysshort daysnarrow ampm eras quarters quartersshort')
+
+NAMES = {
+    'en' : Names(
+        months        = u'January February March April May June July August September October November December'.split(),
+        monthsshort   = u'Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split(),
+        monthsnarrow  = u'J F M A M J J A S O N D'.split(),
+        days          = u'Monday Tuesday Wednesday Thursday Friday Saturday Sunday'.split(),
+        daysshort     = u'Mon Tue Wed Thu Fri Sat Sun'.split(),
+        daysnarrow    = u'M T W T F S S'.split(),
+        ampm          = (u'AM', u'PM'),
+        eras          = (u'BC', u'AD'),
+        quarters      = (u'1st quarter', u'2nd quarter', u'3rd quarter', u'4th quarter'),
+        quartersshort = u'Q1 Q2 Q3 Q4'.split(),
+    ),
+    'de' : Names(
+        months        = u'Januar Februar März April Mai Juni Juli August September Oktober November Dezember'.split(),
+        monthsshort   = u'Jan. Feb. März Apr. Mai Juni Juli Aug. Sept. Okt. Nov. Dez.'.split(),
+        monthsnarrow  = u'J F M A M J J A S O N D'.split(),
+        days          = u'Montag Dienstag Mittwoch Donnerstag Freitag Samstag Sonntag'.split(),
+        daysshort     = u'Mo. Di. Mi. Do. Fr. Sa. So.'.split(),
+        daysnarrow    = u'M D M D F S S'.split(),
+        ampm          = (u'AM', u'PM'),
+        eras          = (u'v. Chr.', u'n. Chr.'),
+        quarters      = (u'1. Quartal', u'2. Quartal', u'3. Quartal', u'4. Quartal'),
+        quartersshort = u'Q1 Q2 Q3 Q4'.split(),
+    ),
+    'es' : Names(
+        months        = u'enero febrero marzo abril mayo junio julio agosto septiembre octubre noviembre diciembre'.split(),
+        monthsshort   = u'ene feb mar abr may jun jul ago sept oct nov dic'.split(),
+        monthsnarrow  = u'E F M A M J J A S O N D'.split(),
+        days          = u'lunes martes miércoles jueves viernes sábado domingo'.split(),
+        daysshort     = u'lun mar mié jue vie sáb dom'.split(),
+        daysnarrow    = u'L M X J V S D'.split(),
+        ampm          = (u'a. m.', u'p. m.'),
+        eras          = (u'a. C.', u'd. C.'),
+        quarters      = (u'1.er trimestre', u'2.º trimestre', u'3.er trimestre', u'4.º trimestre'),
+        quartersshort = u'T1 T2 T3 T4'.split(),
+    ),
+    'fr' : Names(
+        months        = u'janvier février mars avril mai juin juillet août septembre octobre novembre décembre'.split(),
+        monthsshort   = u'janv. févr. mars avr. mai juin juil. août sept. oct. nov. déc.'.split(),
+        monthsnarrow  = u'J F M A M J J A S O N D'.split(),
+        days          = u'lundi mardi mercredi jeudi vendredi samedi dimanche'.split(),
+        daysshort     = u'lun. mar. mer. jeu. ven. sam. dim.'.split(),
+        daysnarrow    = u'L M M J V S D'.split(),
+        ampm          = (u'AM', u'PM'),
+        eras          = (u'av. J.-C.', u'ap. J.-C.'),
+        quarters      = (u'1er trimestre', u'2e trimestre', u'3e trimestre', u'4e trimestre'),
+        quartersshort = u'T1 T2 T3 T4'.split(),
+    ),
+    'nl' : Names(
+        months        = u'januari februari maart april mei juni juli augustus september oktober november december'.split(),
+        monthsshort   = u'jan. feb. mrt. apr. mei jun. jul. aug. sep. okt. nov. dec.'.split(),
+        monthsnarrow  = u'J F M A M J J A S O N D'.split(),
+        days          = u'maandag dinsdag woensdag donderdag vrijdag zaterdag zondag'.split(),
+        daysshort     = u'ma di wo do vr za zo'.split(),
+        daysnarrow    = u'M D W D V Z Z'.split(),
+        ampm          = (u'a.m.', u'p.m.'),
+        eras          = (u'v.Chr.', u'n.Chr.'),
+        quarters      = (u'1e kwartaal', u'2e kwartaal', u'3e kwartaal', u'4e kwartaal'),
+        quartersshort = u'K1 K2 K3 K4'.split(),
+    ),
+    'pt' : Names(
+        months        = u'janeiro fevereiro março abril maio junho julho agosto setembro outubro novembro dezembro'.split(),
+        monthsshort   = u'jan. fev. mar. abr. mai. jun. jul. ago. set. out. nov. dez.'.split(),
+        monthsnarrow  = u'J F M A M J J A S O N D'.split(),
+        days          = u'segunda-feira terça-feira quarta-feira quinta-feira sexta-feira sábado domingo'.split(),
+        daysshort     = u'seg. ter. qua. qui. sex. sáb. dom.'.split(),
+        daysnarrow    = u'S T Q Q S S D'.split(),
+        ampm          = (u'AM', u'PM'),
+        eras          = (u'a.C.', u'd.C.'),
+        quarters      = (u'1º trimestre', u'2º trimestre', u'3º trimestre', u'4º trimestre'),
+        quartersshort = u'T1 T2 T3 T4'.split(),
+    ),
+}
+
+# regions of a language without a region in its locale identifier
+DEFAULT_REGIONS = dict(en = 'US', de = 'DE', es = 'ES', fr = 'FR', nl = 'NL', pt = 'BR')
+
+# the first day of the week (as datetime.weekday()) of regions, as in the
+# week data of CLDR; it is Monday in all other regions
+FIRST_DAYS = {}
+for day, regions in [
+        (6, 'AG AS BD BR BS BT BW BZ CA CN CO DM DO ET GT GU HK HN ID IL IN JM JP KE KH KR LA MH MM MO MT MX MZ NI NP PA PE PH PK PR PT PY SA SG SV TH TT TW UM US VE VI WS YE ZA ZW'),
+        (5, 'AE AF BH DJ DZ EG IQ IR JO KW LY OM QA SD SY'),
+        (4, 'MV'),
+    ]:
+    FIRST_DAYS.update(dict.fromkeys(regions.split(), day))
+
+# regions whose first week of a year (or month) needs at least 4 days of
+# it, as in CLDR; in all other regions, it is the week with the first day
+MINDAYS4 = set('AD AN AT AX BE BG CH CZ DE DK EE ES FI FJ FO FR GB GF GG GI GP GR HU IE IM IS IT JE LI LT LU MC MQ NL NO PL PT RE RU SE SJ SK SM VA'.split())
+
+# the names and week rules for a locale
+class Locale(object):
+
+    def __init__(self, identifier, names, firstweekday, mindays):
+        self.identifier     = identifier
+        self.names          = names
+        # (as datetime.weekday())
+        self.firstweekday   = firstweekday
+        # minimal number of days in the first week of a year (or month)
+        self.mindays        = mindays
+
+_locales = {}
+
+# the Locale for an identifier like 'en', 'nl_NL' or 'pt-BR', or None if
+# the names of its language are unknown, or it has keywords
+def find_locale(identifier):
+    locale = _locales.get(identifier)
+    if locale is None and identifier not in _locales:
+        parts       = re.split(r'[-_.]', identifier or '')
+        language    = parts[0].lower()
+        regions     = [ part.upper() for part in parts[1:] if (len(part) == 2 and part.isalpha()) or (len(part) == 3 and part.isdigit()) ]
+        region      = regions and regions[0] or DEFAULT_REGIONS.get(language)
+        # (keywords may change the calendar, numbers etc.)
+        if language in NAMES and '@' not in (identifier or ''):
+            locale = Locale(identifier, NAMES[language], FIRST_DAYS.get(region, 0), region in MINDAYS4 and 4 or 1)
+        _locales[identifier] = locale
+    return locale
+
+# a time zone with a fixed offset from UTC (in minutes)
+class FixedOffset(tzinfo):
+
+    def __init__(self, minutes, name = None):
+        self.offset = timedelta(minutes = minutes)
+        self.name   = name or _offset(minutes * 60)
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return self.name
+
+    def __repr__(self):
+        return 'FixedOffset(%d, %r)' % (self.offset.days * 1440 + self.offset.seconds // 60, self.name)
+
+UTC = FixedOffset(0, 'UTC')
+
+# time zone of datetime_from_timestamp: the local time zone at a moment
+LOCAL = 'local'
+
+_local_zones = {}
+
+# the local time zone at a number of seconds since 1970, as a FixedOffset
+def local_timezone(seconds):
+    try:
+        whole   = int(math.floor(seconds))
+        local   = time.localtime(whole)
+        offset  = calendar.timegm(local) - whole
+    except (ValueError, OverflowError):
+        return UTC
+    minutes = int(round(offset / 60.0))
+    key     = (minutes, local.tm_isdst > 0)
+    zone    = _local_zones.get(key)
+    if zone is None:
+        zone = _local_zones[key] = FixedOffset(minutes, time.tzname[local.tm_isdst > 0])
+    return zone
+
+_EPOCH = datetime(1970, 1, 1)
+
+# the datetime of a number of seconds since 1970-01-01 00:00:00 UTC (i.e.
+# NSDate.timeIntervalSince1970()): naive in the local time zone, or in the
+# time zone tz (LOCAL: the local time zone at that moment)
+def datetime_from_timestamp(seconds, tz = None):
+    if tz is LOCAL:
+        tz = local_timezone(seconds)
+    try:
+        return datetime.fromtimestamp(seconds, tz)
+    except (ValueError, OverflowError):
+        # outside of the range of the C library; the local time zone is
+        # taken to be UTC there, and dates outside of the range of datetime
+        # (i.e. NSDate.distantPast) are clamped to it
+        try:
+            utc = _EPOCH + timedelta(seconds = seconds)
+        except OverflowError:
+            utc = seconds < 0 and datetime.min or datetime.max
+        if tz is None:
+            return utc
+        try:
+            return tz.fromutc(utc.replace(tzinfo = tz))
+        except OverflowError:
+            return utc.replace(tzinfo = tz)
+
+# datetime_from_timestamp of a list of timestamps
+def datetimes_from_timestamps(timestamps, tz = None):
+    timestamps      = list(timestamps)
+    fromtimestamp   = datetime.fromtimestamp
+    if tz is LOCAL:
+        return [ datetime_from_timestamp(seconds, LOCAL) for seconds in timestamps ]
+    try:
+        if tz is None:
+            return map(fromtimestamp, timestamps)
+        return [ fromtimestamp(seconds, tz) for seconds in timestamps ]
+    except (ValueError, OverflowError):
+        return [ datetime_from_timestamp(seconds, tz) for seconds in timestamps ]
+
+# offset of a datetime from UTC, in seconds
+def _utcoffset(dt):
+    if dt.tzinfo is not None:
+        offset = dt.utcoffset()
+        if offset is not None:
+            return offset.days * 86400 + offset.seconds
+    # local time
+    timetuple = dt.timetuple()
+    return int(calendar.timegm(timetuple) - time.mktime(timetuple))
+
+# the offset as '+HH', '+HHMM', '+HH:MM' etc.
+def _offset(seconds, separator = u'', minutes = True, optional = False):
+    sign            = seconds < 0 and u'-' or u'+'
+    hours, seconds  = divmod(abs(seconds), 3600)
+    mins, seconds   = divmod(seconds, 60)
+    value           = u'%s%02d' % (sign, hours)
+    if minutes or (optional and mins):
+        value += u'%s%02d' % (separator, mins)
+    return value
+
+# localized GMT format: 'GMT+1' (short) or 'GMT+01:00' (long)
+def _gmt(seconds, long = False):
+    if seconds == 0:
+        return u'GMT'
+    if long:
+        return u'GMT' + _offset(seconds, u':')
+    sign            = seconds < 0 and u'-' or u'+'
+    hours, seconds  = divmod(abs(seconds), 3600)
+    mins            = seconds // 60
+    return mins and u'GMT%s%d:%02d' % (sign, hours, mins) or u'GMT%s%d' % (sign, hours)
+
+# start of the first week of a year (as a date)
+def _first_week(year, locale):
+    jan1    = date(year, 1, 1)
+    start   = jan1.toordinal() - (jan1.weekday() - locale.firstweekday) % 7
+    if jan1.toordinal() - start + locale.mindays > 7:
+        # too few days in January
+        start += 7
+    return start
+
+# (week year, week of year) of a date
+def _week_of_year(day, locale):
+    ordinal = day.toordinal()
+    year    = day.year
+    if year < 9999 and ordinal >= _first_week(year + 1, locale):
+        year += 1
+    elif year > 1 and ordinal < _first_week(year, locale):
+        year -= 1
+    return year, (ordinal - _first_week(year, locale)) // 7 + 1
+
+def _week_of_month(day, locale):
+    first   = date(day.year, day.month, 1)
+    start   = first.toordinal() - (first.weekday() - locale.firstweekday) % 7
+    if first.toordinal() - start + locale.mindays > 7:
+        start += 7
+    return (day.toordinal() - start) // 7 + 1
+
+# a numeric field: a function of a datetime returning an int, formatted
+# with (at least) count digits
+_Number = collections.namedtuple('_Number', 'count func')
+
+def _text(count, short, wide, narrow):
+    if count == 4:
+        return wide
+    if count == 5:
+        return narrow
+    return short
+
+# fields of patterns: a function of (letter count, Locale), returning a
+# function of a datetime (returning text) or a _Number
+def _year(count, locale):
+    if count == 2:
+        return lambda dt: u'%02d' % (dt.year % 100)
+    return _Number(count, lambda dt: dt.year)
+
+def _week_year(count, locale):
+    if count == 2:
+        return lambda dt: u'%02d' % (_week_of_year(dt, locale)[0] % 100)
+    return _Number(count, lambda dt: _week_of_year(dt, locale)[0])
+
+def _quarter(count, locale):
+    if count in (3, 4):
+        quarters = count == 4 and locale.names.quarters or locale.names.quartersshort
+        return lambda dt: quarters[(dt.month - 1) // 3]
+    # (narrow: the number)
+    return _Number(count == 2 and 2 or 1, lambda dt: (dt.month - 1) // 3 + 1)
+
+def _month(count, locale):
+    if count >= 3:
+        names = [ _text(count, *names) for names in zip(locale.names.monthsshort, locale.names.months, locale.names.monthsnarrow) ]
+        return lambda dt: names[dt.month - 1]
+    return _Number(count, lambda dt: dt.month)
+
+def _weekday(count, locale):
+    names = [ _text(count, *names) for names in zip(locale.names.daysshort, locale.names.days, locale.names.daysnarrow) ]
+    return lambda dt: names[dt.weekday()]
+
+def _local_weekday(count, locale):
+    if count >= 3:
+        return _weekday(count, locale)
+    return _Number(count, lambda dt: (dt.weekday() - locale.firstweekday) % 7 + 1)
+
+def _era(count, locale):
+    names = locale.names.eras
+    return lambda dt: names[1]
+
+def _ampm(count, locale):
+    names = locale.names.ampm
+    return lambda dt: names[dt.hour >= 12]
+
+def _fraction(count, locale):
+    return lambda dt: (u'%06d' % dt.microsecond)[:count].ljust(count, u'0')
+
+def _zone(count, locale):
+    if count == 4:
+        return lambda dt: _gmt(_utcoffset(dt), True)
+    if count == 5:
+        return lambda dt: _utcoffset(dt) and _offset(_utcoffset(dt), u':') or u'Z'
+    return lambda dt: _offset(_utcoffset(dt))
+
+def _zone_gmt(count, locale):
+    return lambda dt: _gmt(_utcoffset(dt), count == 4)
+
+def _zone_iso(count, locale, utc = None):
+    def iso(dt):
+        seconds = _utcoffset(dt)
+        if utc is not None and seconds == 0:
+            return utc
+        if count == 1:
+            return _offset(seconds, minutes = False, optional = True)
+        if count in (2, 4):
+            return _offset(seconds)
+        return _offset(seconds, u':')
+    return iso
+
+_FIELDS = {
+    'G' : _era,
+    'y' : _year,
+    'u' : _year,
+    'Y' : _week_year,
+    'Q' : _quarter,
+    'q' : _quarter,
+    'M' : _month,
+    'L' : _month,
+    'w' : lambda count, locale: _Number(count, lambda dt: _week_of_year(dt, locale)[1]),
+    'W' : lambda count, locale: _Number(count, lambda dt: _week_of_month(dt, locale)),
+    'd' : lambda count, locale: _Number(count, attrgetter('day')),
+    'D' : lambda count, locale: _Number(count, lambda dt: dt.timetuple().tm_yday),
+    'F' : lambda count, locale: _Number(count, lambda dt: (dt.day - 1) // 7 + 1),
+    'E' : _weekday,
+    'e' : _local_weekday,
+    'c' : _local_weekday,
+    'a' : _ampm,
+    'h' : lambda count, locale: _Number(count, lambda dt: dt.hour % 12 or 12),
+    'H' : lambda count, locale: _Number(count, attrgetter('hour')),
+    'K' : lambda count, locale: _Number(count, lambda dt: dt.hour % 12),
+    'k' : lambda count, locale: _Number(count, lambda dt: dt.hour or 24),
+    'm' : lambda count, locale: _Number(count, attrgetter('minute')),
+    's' : lambda count, locale: _Number(count, attrgetter('second')),
+    'S' : _fraction,
+    'A' : lambda count, locale: _Number(count, lambda dt: ((dt.hour * 60 + dt.minute) * 60 + dt.second) * 1000 + dt.microsecond // 1000),
+    'Z' : _zone,
+    'O' : _zone_gmt,
+    'x' : _zone_iso,
+    'X' : lambda count, locale: _zone_iso(count, locale, u'Z'),
+}
+
+# the max. letter count of the fields (None: any) which are formatted like
+# NSDateFormatter does; other fields (i.e. the stand-alone forms of 'L',
+# 'c' and 'q', and time zone names) and counts (i.e. the wide and narrow
+# eras) are not supported
+_COUNTS = {
+    'G' : 3,    'y' : None, 'u' : None, 'Y' : None, 'Q' : 5,    'q' : 2,
+    'M' : 5,    'L' : 2,    'w' : 2,    'W' : 1,    'd' : 2,    'D' : 3,
+    'F' : 1,    'E' : 5,    'e' : 5,    'c' : 2,    'a' : 3,    'h' : 2,
+    'H' : 2,    'K' : 2,    'k' : 2,    'm' : 2,    's' : 2,    'S' : None,
+    'A' : None, 'Z' : 5,    'O' : 4,    'x' : 5,    'X' : 5,
+}
+
+# a quoted literal ('' is a quote), a field (a letter, repeated), or
+# other literal text
+_token = re.compile(r"'((?:[^']|'')*)(?:'|$)|([A-Za-z])\2*|[^A-Za-z']+")
+
+# a pattern, compiled for a locale (an identifier or a Locale); raises
+# ValueError if the locale or a field of the pattern is not supported
+class DateFormatter(object):
+
+    def __init__(self, pattern, locale = 'en'):
+        if not isinstance(locale, Locale):
+            identifier, locale = locale, find_locale(locale)
+            if locale is None:
+                raise ValueError('unknown locale %r' % identifier)
+        if isinstance(pattern, str):
+            pattern = pattern.decode('utf-8')
+        self.pattern    = pattern
+        self.locale     = locale
+
+        # a format string (with a '%s', or '%0Nd' for numbers, for every
+        # field) and the fields
+        template        = []
+        self._fields    = []
+        for m in _token.finditer(pattern):
+            text, letter = m.group(0), m.group(2)
+            if m.group(1) is not None:
+                text = text == "''" and u"'" or m.group(1).replace("''", "'")
+            elif letter is not None:
+                if letter not in _COUNTS or (_COUNTS[letter] or len(text)) < len(text) or (letter == 'O' and len(text) not in (1, 4)):
+                    raise ValueError('unsupported field %r in pattern %r' % (text, pattern))
+                field = _FIELDS[letter](len(text), locale)
+                if isinstance(field, _Number):
+                    self._fields.append(field.func)
+                    template.append(u'%%0%dd' % field.count)
+                else:
+                    self._fields.append(field)
+                    template.append(u'%s')
+                continue
+            template.append(text.replace(u'%', u'%%'))
+        self._template  = u''.join(template)
+
+    def format(self, dt):
+        return self._template % tuple([ field(dt) for field in self._fields ])
+
+    __call__ = format
+
+_missing = object()
+
+# DateFormatters (or other formatters, created by factory(pattern, locale))
+# by (pattern, locale), shared (and thread-safe); the oldest are dropped if
+# there are more than maxsize
+class FormatterCache(object):
+
+    def __init__(self, factory = None, maxsize = 200):
+        self.factory    = factory or DateFormatter
+        self.maxsize    = maxsize
+        self._cache     = collections.OrderedDict()
+        self._lock      = threading.Lock()
+
+    # the formatter, or None if the pattern or locale is not supported (if
+    # the factory raises ValueError)
+    def get(self, pattern, locale = 'en'):
+        # (looking up a dict is atomic, so hits need no lock)
+        key         = (pattern, locale)
+        formatter   = self._cache.get(key, _missing)
+        if formatter is not _missing:
+            return formatter
+        try:
+            formatter = self.factory(pattern, locale)
+        except ValueError:
+            formatter = None
+        with self._lock:
+            self._cache[key] = formatter
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last = False)
+        return formatter
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+formatters = FormatterCache()
+
+# the compiled (and cached) DateFormatter of a pattern and locale; raises
+# ValueError if they are not supported
+def get_formatter(pattern, locale = 'en'):
+    formatter = formatters.get(pattern, locale)
+    if formatter is None:
+        # (raises the error)
+        formatter = DateFormatter(pattern, locale)
+    return formatter
+
+def format_datetime(dt, pattern, locale = 'en'):
+    return get_formatter(pattern, locale).format(dt)
+
+# strftime formatting characters, as Unicode date patterns
+STRFTIME_TO_UNICODE = {
+    '%Y'    : 'yyyy',
+    '%m'    : 'MM',
+    '%d'    : 'dd',
+    '%H'    : 'HH',
+    '%I'    : 'hh',
+    '%p'    : 'a',
+    '%M'    : 'mm',
+    '%S'    : 'ss',
+    '%U'    : 'w',
+    '%b'    : 'MMM',
+    '%B'    : 'MMMM',
+    '%a'    : 'E',
+    '%A'    : 'EEEE',
+    '%x'    : 'EEE MMM dd yyyy',
+    '%X'    : 'HH:mm:ss',
+    '%z'    : 'Z',
+}
+
+_strftime       = re.compile(r'(%[a-zA-Z])')
+_strftime_cache = {}
+
+# convert the formatting characters of a strftime format to a Unicode date
+# pattern (other text is kept as is); the conversions are cached
+def strftime_to_unicode(fmt):
+    pattern = _strftime_cache.get(fmt)
+    if pattern is None:
+        if len(_strftime_cache) >= 1000:
+            _strftime_cache.clear()
+        pattern = _strftime_cache[fmt] = _strftime.sub(
+            lambda m: STRFTIME_TO_UNICODE.get(m.group(1), m.group(1)),
+            fmt
+        )
+    return pattern
@@ -0,0 +1,130 @@
+# Event handling of MailApp.sendEvent (see fixer), which is called for every
+# event Mail receives. It only needs the event objects, not AppKit, so it
+# can be benchmarked outside of Mail.
+
+# event types and modifier flags (the values of the AppKit constants)
+NSKeyDown           = 10
+NSFlagsChanged      = 12
+NSShiftKeyMask      = 1 << 17
+NSControlKeyMask    = 1 << 18
+NSAlternateKeyMask  = 1 << 19
+NSCommandKeyMask    = 1 << 20
+
+# the modifiers of shortcuts
+MODIFIERS = {
+    'shift' : NSShiftKeyMask,
+    'ctrl'  : NSControlKeyMask,
+    'opt'   : NSAlternateKeyMask,
+    'alt'   : NSAlternateKeyMask,
+    'cmd'   : NSCommandKeyMask,
+}
+MODIFIER_MASK = NSShiftKeyMask | NSControlKeyMask | NSAlternateKeyMask | NSCommandKeyMask
+
+# shortcuts for which the Option key is stripped when the 'toggle key' is
+# used with them: reply and reply-all (with and without Command)
+DEFAULT_SHORTCUTS = [ 'opt-r', 'shift-opt-r', 'cmd-opt-r', 'cmd-shift-opt-r' ]
+
+# parse a shortcut like 'cmd-opt-r' into (key, modifier flags): modifiers
+# and a key, separated by '-' or '+'. The key is a character, matched with
+# the characters of the event in the current keyboard layout (ignoring
+# modifiers but Shift, and case), or a virtual key code of two or more
+# digits (i.e. '15' for the key of 'r' in the ANSI layout), matched with
+# the key code of the event.
+def parse_shortcut(shortcut):
+    if not isinstance(shortcut, basestring):
+        raise ValueError('shortcut %r is no string' % (shortcut,))
+    tokens  = shortcut.lower().replace('+', '-').split('-')
+    key     = tokens.pop()
+    flags   = 0
+    for token in tokens:
+        if token not in MODIFIERS:
+            raise ValueError('unknown modifier %r in shortcut %r' % (token, shortcut))
+        flags |= MODIFIERS[token]
+    if key.isdigit() and len(key) > 1:
+        return int(key), flags
+    if len(key) == 1:
+        return unicode(key), flags
+    raise ValueError('unknown key %r in shortcut %r' % (key, shortcut))
+
+# keeps track of the 'toggle key' (Option, without Control) in
+# app.toggle_key_active, and strips the Option key from shortcuts used
+# with it (i.e. Option-Command-R for reply)
+class EventHook(object):
+
+    def __init__(self, strip_option):
+        # strip_option(event) returns a copy of a key event without the
+        # Option key
+        self.strip_option   = strip_option
+        self.app            = None
+        self.toggle_active  = False
+        self.shortcuts      = {}
+        self.keycodes       = False
+        self.invalid        = []
+        self.defaulted      = False
+
+    # shortcuts: the shortcuts to strip the Option key from, i.e. the
+    # value of the preference: a list of strings, a single string, or None
+    # for the defaults. Invalid ones are ignored, and are in self.invalid;
+    # if none of them is valid (or shortcuts is no list at all), the
+    # defaults are used, and self.defaulted is set.
+    def register(self, app, shortcuts = None):
+        self.app            = app
+        self.toggle_active  = app.toggle_key_active
+
+        # (character or key code, modifier flags) -> action, for key
+        # events with the toggle key
+        self.shortcuts      = {}
+        self.keycodes       = False
+        self.invalid        = []
+        self.defaulted      = False
+        if shortcuts is None:
+            shortcuts = DEFAULT_SHORTCUTS
+        elif isinstance(shortcuts, basestring):
+            shortcuts = [ shortcuts ]
+        try:
+            shortcuts = list(shortcuts)
+        except TypeError:
+            self.invalid.append(shortcuts)
+            shortcuts = []
+        for shortcut in shortcuts:
+            self._add(shortcut)
+        if self.invalid and not self.shortcuts:
+            self.defaulted = True
+            for shortcut in DEFAULT_SHORTCUTS:
+                self._add(shortcut)
+
+    def _add(self, shortcut):
+        try:
+            key, flags = parse_shortcut(shortcut)
+        except ValueError:
+            self.invalid.append(shortcut)
+            return
+        if not (flags & NSAlternateKeyMask) or (flags & NSControlKeyMask):
+            # never used with the toggle key
+            self.invalid.append(shortcut)
+            return
+        self.shortcuts[(key, flags)] = self.strip_option
+        if isinstance(key, int):
+            self.keycodes = True
+
+    def sendEvent(self, mailapp, original, event):
+        event_type = event.type()
+        # only key- and modifier-events are looked at, all others (mouse,
+        # scroll, ...) are passed on directly
+        if (event_type != NSKeyDown and event_type != NSFlagsChanged) or self.app is None:
+            return original(mailapp, event)
+
+        flags   = event.modifierFlags()
+        toggle  = bool(flags & NSAlternateKeyMask) and not (flags & NSControlKeyMask)
+        if event_type == NSFlagsChanged:
+            # keep track of an active option key
+            if toggle != self.toggle_active:
+                self.toggle_active = self.app.toggle_key_active = toggle
+        elif toggle:
+            flags   &= MODIFIER_MASK
+            action  = self.shortcuts.get((event.charactersIgnoringModifiers().lower(), flags))
+            if action is None and self.keycodes:
+                action = self.shortcuts.get((event.keyCode(), flags))
+            if action is not None:
+                event = action(event)
+        return original(mailapp, event)
@@ -1,7 +1,8 @@
-from    AppKit                  import NSRunAlertPanel, NSAlternateKeyMask, NSEvent, NSKeyDown, NSControlKeyMask, MessageViewer
+from    AppKit                  import NSRunAlertPanel, NSAlternateKeyMask, NSEvent, MessageViewer
 from    Foundation              import NSLog
 from    mailtrack.utils          import swizzle
 from    mailtrack.attribution    import CustomizedAttribution
+from    mailtrack.events         import EventHook
 from    mailtrack.messagetypes   import *
 from    objc                    import Category, lookUpClass
 from    logger                  import logger
@@ -9,40 +10,39 @@ import  re, traceback, objc
 
 DOMText = lookUpClass('DOMText')
 
+# strip the Option-key from a key event
+def strip_option(event):
+    return NSEvent.keyEventWithType_location_modifierFlags_timestamp_windowNumber_context_characters_charactersIgnoringModifiers_isARepeat_keyCode_(
+        event.type(),
+        event.locationInWindow(),
+        event.modifierFlags() & ~NSAlternateKeyMask,
+        event.timestamp(),
+        event.windowNumber(),
+        event.context(),
+        event.characters(),
+        event.charactersIgnoringModifiers(),
+        event.isARepeat(),
+        event.keyCode()
+    )
+
+event_hook = EventHook(strip_option)
+
 MailApp = lookUpClass('MailApp')
 class MailApp(Category(MailApp)):
 
     @classmethod
     def registerMailTrackApplication(cls, app):
         cls.app = app
-
-    @swizzle(MailApp, 'sendEvent:')
-    def sendEvent(self, original, event):
-        if not hasattr(self, 'app'):
-            original(self, event)
-            return
-        self.app.toggle_key_active = False
-        # keep track of an active option key
-        flags = event.modifierFlags()
-        if (flags & NSAlternateKeyMask) and not (flags & NSControlKeyMask):
-            self.app.toggle_key_active = True
-            # handle reply/reply-all (XXX: won't work if you have assigned
-            # a different shortcut key to these actions!)
-            if event.type() == NSKeyDown and event.charactersIgnoringModifiers().lower() == 'r':
-                # strip the Option-key from the event
-                event = NSEvent.keyEventWithType_location_modifierFlags_timestamp_windowNumber_context_characters_charactersIgnoringModifiers_isARepeat_keyCode_(
-                    event.type(),
-                    event.locationInWindow(),
-                    event.modifierFlags() & ~NSAlternateKeyMask,
-                    event.timestamp(),
-                    event.windowNumber(),
-                    event.context(),
-                    event.characters(),
-                    event.charactersIgnoringModifiers(),
-                    event.isARepeat(),
-                    event.keyCode()
-                )
-        original(self, event)
+        # the shortcuts are only read here, so changes need a restart
+        event_hook.register(app, app.toggle_shortcuts)
+        for shortcut in event_hook.invalid:
+            logger.warning(('invalid toggle-key shortcut: %r' % (shortcut,)).replace('%', '%%'))
+        if event_hook.defaulted:
+            logger.warning('no valid toggle-key shortcuts, using the defaults')
+
+    # runs for every event, so only key- and modifier-events are looked
+    # at (see events.EventHook)
+    sendEvent = swizzle(MailApp, 'sendEvent:')(event_hook.sendEvent)
 
 # our own DocumentEditor implementation
 DocumentEditor = lookUpClass('DocumentEditor')
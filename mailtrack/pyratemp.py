@@ -179,8 +179,11 @@ IN THE SOFTWARE."""
 
 #=========================================
 
-import __builtin__, os
+import __builtin__, os, sys, types
 import re
+import hashlib, marshal, tempfile
+import ast, bisect, collections, functools, itertools, opcode, operator, threading
+from timeit import default_timer as _timer
 
 #=========================================
 # some useful functions
@@ -250,6 +253,52 @@ def dummy_raise(exception, value):
 (NONE, HTML, LATEX) = range(0, 3)
 ESCAPE_SUPPORTED = {"NONE":None, "HTML":HTML, "LATEX":LATEX} #for error-/parameter-checking
 
+# LaTeX special characters; replaced in a single pass, since some of the
+# replacements contain special characters themselves
+_LATEX_ESCAPES = {
+    u"\\": u"\\textbackslash{}",
+    u"#":  u"\\#",
+    u"$":  u"\\$",
+    u"%":  u"\\%",
+    u"&":  u"\\&",
+    u"_":  u"\\_",
+    u"{":  u"\\{",
+    u"}":  u"\\}",
+    u"~":  u"\\textasciitilde{}",
+    u"^":  u"\\textasciicircum{}",
+    u"<":  u"\\textless{}",
+    u">":  u"\\textgreater{}",
+    u"|":  u"\\textbar{}",
+}
+_reLatexEscape = re.compile(u"[%s]" % re.escape(u"".join(_LATEX_ESCAPES)))
+
+# HTML special characters
+_HTML_ESCAPES = {
+    u"&":  u"&amp;",
+    u"<":  u"&lt;",
+    u">":  u"&gt;",
+    u'"':  u"&quot;",
+    u"'":  u"&#39;",
+}
+_reHtmlEscape  = re.compile(u"""[&<>"']""")
+
+# memo of recently escaped short strings (e.g. names, addresses, dates)
+_ESCAPE_MEMO_MAXLEN  = 100
+_ESCAPE_MEMO_SIZE    = 1000
+_escape_memo = {HTML: {}, LATEX: {}}
+
+def _escape_html_char(match, _escapes=_HTML_ESCAPES):
+    return _escapes[match.group()]
+
+def _escape_latex_char(match, _escapes=_LATEX_ESCAPES):
+    return _escapes[match.group()]
+
+# (search, substitute, replacement-function) per format
+_ESCAPERS = {
+    HTML:  (_reHtmlEscape.search, _reHtmlEscape.sub, _escape_html_char),
+    LATEX: (_reLatexEscape.search, _reLatexEscape.sub, _escape_latex_char),
+}
+
 def escape(s, format=HTML):
     """Replace special characters by their escape sequence.
 
@@ -259,43 +308,42 @@ def escape(s, format=HTML):
 
           - `NONE`:  nothing is replaced
           - `HTML`:  replace &<>'" by &...;
-          - `LATEX`: replace \#$%&_{} (TODO! - this is very incomplete!)
+          - `LATEX`: replace \#$%&_{}~^<>| by LaTeX-commands
     :Returns:
         the escaped string in unicode
     :Exceptions:
         - `ValueError`: if `format` is invalid.
-
-    :TODO:  complete LaTeX-escaping, optimize speed
     """
-    #Note: If you have to make sure that every character gets replaced
-    #      only once (and if you cannot achieve this with the following code),
-    #      use something like u"".join([replacedict.get(c,c) for c in s])
-    #      which is about 2-3 times slower (but maybe needs less memory).
     #Note: This is one of the most time-consuming parts of the template.
-    #      So maybe speed this up.
-
+    #      Most strings contain nothing to escape, and the same values
+    #      (names, addresses, ...) are escaped again and again, so:
+    #      - recently escaped short strings are memoized (long strings
+    #        are not even looked up, which would hash them),
+    #      - a single search checks if anything has to be replaced at all,
+    #      - all special characters are replaced in a single pass.
     if format is None or format == NONE:
-        pass
-    elif format == HTML:
-        s = s.replace(u"&", u"&amp;") # must be done first!
-        s = s.replace(u"<", u"&lt;")
-        s = s.replace(u">", u"&gt;")
-        s = s.replace(u'"', u"&quot;")
-        s = s.replace(u"'", u"&#39;")
-    elif format == LATEX:
-        #TODO: which are the "reserved" characters for LaTeX?
-        #      are there more than these?
-        s = s.replace("\\", u"\\backslash{}")   #must be done first!
-        s = s.replace("#",  u"\\#")
-        s = s.replace("$",  u"\\$")
-        s = s.replace("%",  u"\\%")
-        s = s.replace("&",  u"\\&")
-        s = s.replace("_",  u"\\_")
-        s = s.replace("{",  u"\\{")
-        s = s.replace("}",  u"\\}")
-    else:
+        return unicode(s)
+    try:
+        (search, sub, replace) = _ESCAPERS[format]
+    except (KeyError, TypeError):
         raise ValueError('Invalid format (only None, HTML and LATEX are supported).')
-    return unicode(s)
+    if len(s) > _ESCAPE_MEMO_MAXLEN:
+        if search(s) is None:
+            return unicode(s)
+        return sub(replace, unicode(s))
+
+    memo = _escape_memo[format]
+    e = memo.get(s)
+    if e is not None:
+        return e
+    if search(s) is None:
+        e = unicode(s)
+    else:
+        e = sub(replace, unicode(s))
+    if len(memo) >= _ESCAPE_MEMO_SIZE:
+        memo.clear()
+    memo[s] = e
+    return e
 
 #=========================================
 
@@ -401,9 +449,531 @@ class LoaderFile:
 
         return u
 
+#-----------------------------------------
+# Parse-tree cache
+
+class ParseTreeCache:
+    """Persistent on-disk cache for parse-trees of template-files.
+
+    Stores the parse-tree and the compiled expressions of a template in a
+    directory, so that loading the same template again (e.g. after a
+    restart) does not need to parse it. The cache-files are keyed by the
+    template-contents and the pyratemp- and Python-version; an entry is
+    only used if none of the included templates has changed.
+
+    Use it by passing it to ``Template(filename=..., cache=...)``.
+    ``hits`` and ``misses`` count the lookups.
+
+    :Note: The compiled expressions are checked before they are used (see
+           `EvalPseudoSandbox.add_compiled`), but the parse-trees are not
+           validated, so only use a directory which is not writable by
+           others.
+    """
+    # format-version of the cache-files
+    version = 1
+
+    def __init__(self, path):
+        """Init the cache.
+
+        :Parameters:
+            - `path`: directory of the cache-files
+        :Exceptions:
+            - `ValueError`: if `path` is not a directory
+        """
+        if not os.path.isdir(path):
+            raise ValueError("'path' has to be a directory.")
+        self.path   = path
+        self.hits   = 0
+        self.misses = 0
+
+    def key(self, template, *params):
+        """Get the cache-key of a template.
+
+        :Parameters:
+            - `template`: template-unicode-string
+            - `params`:   other parameters, which influence the parse-tree
+        """
+        h = hashlib.sha1(repr((self.version, __version__, sys.version, params)))
+        h.update(template.encode('utf-8'))
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ".pyratemp")
+
+    def load(self, key, loadfunc):
+        """Load a cached template.
+
+        :Parameters:
+            - `key`:      cache-key (see `key()`)
+            - `loadfunc`: function to load included templates, to check
+              if they have changed
+        :Returns: ``(parsetree, codes, includes)``, where codes are the
+                  compiled expressions (``{expr: code}``) and includes the
+                  filenames of the included templates, or None if the
+                  template is not in the cache (or is outdated)
+        """
+        try:
+            f = open(self._filename(key), 'rb')
+            try:
+                (parsetree, includes, codes) = marshal.load(f)
+            finally:
+                f.close()
+            for (filename, digest) in includes:
+                if hashlib.sha1(loadfunc(filename).encode('utf-8')).hexdigest() != digest:
+                    raise ValueError("Included template '%s' has changed." % filename)
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (parsetree, codes, [filename for (filename, digest) in includes])
+
+    def store(self, key, parsetree, includes, codes):
+        """Store a template in the cache.
+
+        :Parameters:
+            - `key`:       cache-key (see `key()`)
+            - `parsetree`: the parse-tree
+            - `includes`:  ``[(filename, unicode-string), ...]`` of all
+              included templates
+            - `codes`:     the compiled expressions (``{expr: code}``)
+        :Note: Errors are ignored, since the cache is only an optimization.
+        """
+        includes = [(filename, hashlib.sha1(u.encode('utf-8')).hexdigest()) for (filename, u) in includes]
+        try:
+            data = marshal.dumps((parsetree, includes, codes))
+            fd, tmpname = tempfile.mkstemp(dir=self.path)
+        except (ValueError, EnvironmentError):
+            return
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmpname, self._filename(key))     # atomic replace
+        except EnvironmentError:
+            try:
+                os.remove(tmpname)
+            except EnvironmentError:
+                pass
+
+#-----------------------------------------
+# Template-registry
+
+class TemplateRegistry:
+    """Registry of the template-files in a directory.
+
+    Templates are only loaded and parsed once, and included templates are
+    parsed once for all templates including them. The registry records
+    which templates depend on which (included) files, so that if a file
+    changes, only the templates depending on it are parsed again.
+
+    :Usage:
+        ::
+            registry = TemplateRegistry("templates/")
+            output = registry.get("reply.tmpl")(...)
+            ...
+            registry.refresh()      (<- after files were changed)
+    """
+
+    def __init__(self, path, encoding='utf-8', **kwargs):
+        """Init the registry.
+
+        :Parameters:
+            - `path`:     directory of the template-files
+            - `encoding`: encoding of the template-files
+            - `kwargs`:   further parameters for `Template` (i.e. `escape`),
+              used for all templates
+        :Exceptions:
+            - `ValueError`: if `path` is not a directory
+        """
+        if not os.path.isdir(path):
+            raise ValueError("'path' has to be a directory.")
+        self.path      = path
+        self.encoding  = encoding
+        self._kwargs   = kwargs
+        self._templates = {}    # filename -> Template
+        self._includes  = {}    # parse-trees of included templates (see Parser)
+        self._stamps    = {}    # filename -> stamp of all loaded files
+        self._lock      = threading.Lock()
+
+    def _stamp(self, filename):
+        """Get the modification-time and size of a file, or None."""
+        try:
+            st = os.stat(os.path.join(self.path, filename))
+        except EnvironmentError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def get(self, filename):
+        """Get a template, load and parse it if necessary.
+
+        :Parameters:
+            - `filename`: filename of the template without path
+        :Returns: the `Template`
+        :Exceptions:
+            - `ValueError`: if `filename` contains a path
+            - `TemplateException`, `EnvironmentError`: if the template
+              cannot be loaded or parsed
+        """
+        if filename != os.path.basename(filename):
+            raise ValueError("No path allowed in filename. (%s)" %(filename))
+        with self._lock:
+            template = self._templates.get(filename)
+            if template is None:
+                stamp = self._stamp(filename)
+                template = Template(filename=os.path.join(self.path, filename), encoding=self.encoding,
+                                    includes=self._includes, **self._kwargs)
+                self._stamps[filename] = stamp
+                for name in template.dependencies:
+                    self._stamps.setdefault(name, self._stamp(name))
+                self._templates[filename] = template
+            return template
+
+    def dependents(self, filename):
+        """Get the loaded templates, which depend on a file.
+
+        :Parameters:
+            - `filename`: filename of a template or an included template
+        :Returns: the filenames of the loaded templates which are or
+                  include `filename`
+        """
+        return set([name for (name, template) in self._templates.items()
+                    if name == filename or filename in template.dependencies])
+
+    def invalidate(self, filename):
+        """Forget a (changed) file and everything depending on it.
+
+        The templates depending on the file are loaded and parsed again by
+        the next `get()`; all other templates and included templates are
+        kept.
+
+        :Parameters:
+            - `filename`: filename of a template or an included template
+        :Returns: the filenames of the forgotten templates
+        """
+        with self._lock:
+            dependents = self.dependents(filename)
+            for name in dependents:
+                del self._templates[name]
+            for (key, (parsetree, escape, dependencies)) in self._includes.items():
+                if key[0] == filename or filename in dependencies:
+                    del self._includes[key]
+            self._stamps.pop(filename, None)
+            return dependents
+
+    def refresh(self):
+        """Forget all files, which have changed since they were loaded.
+
+        :Returns: the filenames of the forgotten templates
+        """
+        changed = [name for (name, stamp) in self._stamps.items() if self._stamp(name) != stamp]
+        dependents = set()
+        for name in changed:
+            dependents.update(self.invalidate(name))
+        return dependents
+
 #-----------------------------------------
 # Parser
 
+class _Block(object):
+    """A block-tag found by `_BlockLexer`.
+
+    ``kind`` is one of:
+
+    - "mEnd":   multi-line end-tag (``indent``, ``ignored``)
+    - "sEnd":   single-line end-tag
+    - "single": single-line block (``indent``: spaces before the tag,
+      ``keyword``, ``param``, ``content``)
+    - "multi":  multi-line block (``indent``, ``keyword``, ``param``,
+      ``ignored``, ``content``)
+
+    All positions are indices into the lexed template.
+    """
+    __slots__ = ("kind", "start", "end", "indent", "keyword",
+                 "param", "param_pos", "content", "content_pos",
+                 "ignored", "ignored_pos")
+
+    def __init__(self, kind, start, end, indent="", keyword=None,
+                 param=None, param_pos=None, content=None, content_pos=None,
+                 ignored=None, ignored_pos=None):
+        self.kind        = kind
+        self.start       = start
+        self.end         = end
+        self.indent      = indent
+        self.keyword     = keyword
+        self.param       = param
+        self.param_pos   = param_pos
+        self.content     = content
+        self.content_pos = content_pos
+        self.ignored     = ignored
+        self.ignored_pos = ignored_pos
+
+class _BlockLexer(object):
+    """Find the block-tags of a template.
+
+    Finds exactly the same blocks as the block-regexp pyratemp used before
+    (see `Parser` for the syntax), but without backtracking: The positions
+    of all start-/end-tags and line-breaks are collected once, and every
+    possible match is then decided by binary searches in these lists. So
+    the time needed is O(n log n) for every template, even for unbalanced
+    or otherwise broken templates (where the regexp needed O(n^2) or more).
+
+    The lexer is created once per template; the content of a block is
+    lexed by `blocks` with the range of the content, as if the content
+    was a separate template.
+
+    Usage: ``for block in _BlockLexer(template, "{%", "%}").blocks(): ...``
+    """
+    _reWs      = re.compile(r"\s*")
+    _reSpace   = re.compile(r"[ \t]*")
+    _reWord    = re.compile(r"\w+")
+    _reNewline = re.compile(r"\n")
+    _whitespace = " \t\n\r\f\v"
+    _regexps   = {}     # (block_start, block_end) -> regexps, see `_compile`
+
+    @classmethod
+    def _compile(cls, block_start, block_end):
+        """Get the regexps to find start-tags, end-tags, "end"-tags and
+        lines starting with a start-tag.
+
+        (These regexps are linear, since they do not need backtracking.)
+        """
+        try:
+            return cls._regexps[(block_start, block_end)]
+        except KeyError:
+            s, e = re.escape(block_start), re.escape(block_end)
+            regexps = (re.compile(s), re.compile(e),
+                       re.compile(r"%s\s*end\s*%s" % (s, e)),
+                       re.compile(r"^([ \t]*)%s" % s, re.M))
+            cls._regexps[(block_start, block_end)] = regexps
+            return regexps
+
+    def __init__(self, template, block_start, block_end):
+        """
+        :Parameters:
+            - `template`:    template-string
+            - `block_start`, `block_end`: start-/end-tag of blocks
+        """
+        reStart, reEnd, reEndTag, reTagLine = self._compile(block_start, block_end)
+        self.template = template
+        self._start   = block_start
+        self._end     = block_end
+        self._opens    = [m.start() for m in reStart.finditer(template)]
+        self._closes   = [m.start() for m in reEnd.finditer(template)]
+        self._newlines = [m.start() for m in self._reNewline.finditer(template)]
+        self._ws_memo  = {}
+        self._runs     = {}
+
+        # end-tags: start -> end
+        self._endtags = dict((m.start(), m.end()) for m in reEndTag.finditer(template))
+        self._ends = sorted(self._endtags)
+
+        # lines starting with a (indented) start-tag: indentation -> line-starts
+        self._taglines = {}
+        for match in reTagLine.finditer(template):
+            self._taglines.setdefault(match.group(1), []).append(match.start())
+
+    # All following methods only look at template[:hi], i.e. the end of
+    # the currently lexed block-content.
+
+    @staticmethod
+    def _first(positions, lo, hi):
+        """Get the first position in ``[lo, hi)``, or -1."""
+        i = bisect.bisect_left(positions, lo)
+        if i < len(positions) and positions[i] < hi:
+            return positions[i]
+        return -1
+
+    def _ws(self, i, hi):
+        """Skip whitespace (like ``\\s*``) starting at `i`."""
+        j = self._ws_memo.get(i)
+        if j is None:
+            j = self._ws_memo[i] = self._reWs.match(self.template, i).end()
+        return min(j, hi)
+
+    def _eol(self, i, hi):
+        """Get the end of the line containing `i`."""
+        i = self._first(self._newlines, i, hi)
+        return hi if i < 0 else i
+
+    def _open(self, lo, hi_pos, hi):
+        """Get the first start-tag (i.e. "{%") in ``[lo, hi_pos)``, or -1."""
+        return self._first(self._opens, lo, min(hi_pos, hi - len(self._start) + 1))
+
+    def _close(self, lo, hi_pos, hi):
+        """Get the first end-tag (i.e. "%}") in ``[lo, hi_pos)``, or -1."""
+        return self._first(self._closes, lo, min(hi_pos, hi - len(self._end) + 1))
+
+    def _endtag(self, q, hi):
+        """Get the end of the "end"-tag at `q`, or None."""
+        end = self._endtags.get(q)
+        if end is not None and end <= hi:
+            return end
+        return None
+
+    def _has_endtag(self, lo, hi_pos, hi):
+        """Test if an "end"-tag starts in ``[lo, hi_pos)``."""
+        q = self._first(self._ends, lo, hi_pos)
+        # (since "end"-tags cannot overlap, only the last one can exceed `hi`)
+        return q >= 0 and self._endtags[q] <= hi
+
+    def _param_end(self, lo, i):
+        """Get the end of a block-parameter, i.e. strip whitespace before `i`."""
+        try:
+            run = self._runs[i]
+        except KeyError:
+            t = self.template
+            run = i
+            while run > 0 and t[run-1] in self._whitespace:
+                run -= 1
+            self._runs[i] = run
+        return max(lo, run)
+
+    def _lookahead(self, q, hi):
+        """Test if a single-line block can end at `q`.
+
+        That is the case if there is an "end"-tag at `q`, or another tag
+        (i.e. 'elif'/'else') at `q` and an "end"-tag after it (in the same
+        line).
+        """
+        if self._endtag(q, hi) is not None:
+            return True
+        t = self.template
+        eol = self._eol(self._ws(q + len(self._start), hi), hi)
+        r = self._close(q + len(self._start), eol, hi)
+        if r >= 0 and self._has_endtag(r + len(self._end), eol, hi):
+            return True
+        if eol < hi:
+            r = self._ws(eol, hi)
+            c = r + len(self._end)
+            if t.startswith(self._end, r, hi) and self._has_endtag(c, self._eol(c, hi), hi):
+                return True
+        return False
+
+    def _single_content_end(self, c, hi):
+        """Get the end of the content of a single-line block, or -1."""
+        eol = self._eol(c, hi)
+        q = self._open(c, eol, hi)
+        if q < 0:
+            return -1
+        if self._lookahead(q, hi):
+            return q
+        # Only "end"-tags and the last tag of the line (if the next
+        # "end"-tag follows in one of the next lines) may end the block now.
+        end = self._first(self._ends, q + 1, eol)
+        if end >= 0 and self._endtags[end] > hi:
+            end = -1
+        last = self._opens[bisect.bisect_left(self._opens, min(eol, hi - len(self._start) + 1)) - 1]
+        if last > q and (end < 0 or last < end) and self._lookahead(last, hi):
+            return last
+        return end
+
+    def _multi_content_end(self, eol, indent, hi):
+        """Get the end of the content of a multi-line block, or -1."""
+        if eol >= hi:
+            return -1
+        lines = self._taglines.get(indent)
+        if lines is None:
+            return -1
+        ce = self._first(lines, eol + 1, hi)
+        if ce < 0 or self._close(ce + len(indent) + len(self._start), hi, hi) < 0:
+            return -1
+        return ce
+
+    def _tag_ends(self, a, hi):
+        """Get the possible ends of a start-tag, whose parameter starts at `a`.
+
+        The start-tag ends in the same line ("... %}"), or at the beginning
+        of one of the next lines ("...\\n   %}").
+
+        :Returns: list of ``(end-tag-position, end-of-line)``
+        """
+        eol = self._eol(a, hi)
+        ends = []
+        r = self._close(a, eol, hi)
+        if r >= 0:
+            ends.append((r, r))
+        if eol < hi:
+            r = self._ws(eol, hi)
+            if self.template.startswith(self._end, r, hi):
+                ends.append((r, eol))
+        return ends
+
+    def _block(self, p, s, bol, hi):
+        """Get the single-line or multi-line block-tag at `p`, or None.
+
+        :Parameters:
+            - `p`: start of the block (incl. whitespace before the tag)
+            - `s`: position of the start-tag
+            - `bol`: True if `p` is at the beginning of a line, i.e. if
+              this may be a multi-line block
+            - `hi`: end of the lexed template-part
+        """
+        t = self.template
+        match = self._reWord.match(t, self._ws(s + len(self._start), hi), hi)
+        if match is None:
+            return None
+        a = self._reSpace.match(t, match.end(), hi).end()
+        tag_ends = self._tag_ends(a, hi)
+        for r, x in tag_ends:
+            c = r + len(self._end)
+            ce = self._single_content_end(c, hi)
+            if ce >= 0:
+                return _Block("single", p, ce, t[p:s], match.group(),
+                              t[a:self._param_end(a, x)], a, t[c:ce], c)
+        if not bol:
+            return None
+
+        if a != self._ws(a, hi):
+            a = self._ws(a, hi)
+            tag_ends = self._tag_ends(a, hi)
+        for r, x in tag_ends:
+            c = r + len(self._end)
+            eol = self._eol(c, hi)
+            ce = self._multi_content_end(eol, t[p:s], hi)
+            if ce >= 0:
+                return _Block("multi", p, ce, t[p:s], match.group(),
+                              t[a:self._param_end(a, x)], a, t[eol+1:ce], eol+1, t[c:eol], c)
+        return None
+
+    def blocks(self, lo=0, hi=None):
+        """Find the blocks in ``template[lo:hi]``.
+
+        :Returns: generator of `_Block`
+        """
+        t = self.template
+        if hi is None:
+            hi = len(t)
+        pos = lo
+        opens = self._opens
+        for i in xrange(bisect.bisect_left(opens, lo), len(opens)):
+            s = opens[i]
+            if s + len(self._start) > hi:
+                break
+            if s < pos:
+                continue
+            p = s               # start of the block, incl. spaces/tabs before the tag
+            while p > pos and t[p-1] in " \t":
+                p -= 1
+            bol = (p == lo or t[p-1] == "\n")
+
+            block = None
+            end = self._endtag(s, hi)
+            if bol and end is not None:
+                eol = self._eol(end, hi)
+                block = _Block("mEnd", p, min(eol + 1, hi), t[p:s],
+                               ignored=t[end:eol], ignored_pos=end)
+            elif p == s and end is not None:
+                block = _Block("sEnd", s, end)
+            else:
+                block = self._block(p, s, bol, hi)
+                if block is None and end is not None:
+                    block = _Block("sEnd", s, end)
+            if block is not None:
+                pos = block.end
+                yield block
+
 class Parser(object):
     """Parse a template into a parse-tree.
     
@@ -430,18 +1000,14 @@ class Parser(object):
     _reComment = re.compile(_strComment, re.M)
 
     # escaped or unescaped substitution
-    #   single-line ("|$" is needed to be able to generate good error-messges)
-    _strSubstitution = r"""
-                    (
-                    %s\s*(?P<sub>.*?)\s*(?P<end>%s|$)       #substitution
-                    |
-                    %s\s*(?P<escsub>.*?)\s*(?P<escend>%s|$) #escaped substitution
-                    )
-                """ % (re.escape(_sub_start),    re.escape(_sub_end),
-                       re.escape(_subesc_start), re.escape(_subesc_end))
-    _reSubstitution = re.compile(_strSubstitution, re.X|re.M)
-
-    # block
+    #   single-line (ending at end-of-line is needed to be able to generate
+    #   good error-messges); see `_substitutions`
+    _reSubStart = re.compile("%s|%s" % (re.escape(_sub_start), re.escape(_subesc_start)))
+    _reSubNext  = {_sub_start:    re.compile(r"\s|" + re.escape(_sub_end)),
+                   _subesc_start: re.compile(r"\s|" + re.escape(_subesc_end))}
+    _reWs       = re.compile(r"\s*")
+
+    # block (see `_BlockLexer`)
     #   - single-line, no nesting.
     #   or
     #   - multi-line, nested by whitespace indentation:
@@ -451,28 +1017,7 @@ class Parser(object):
     #       the same indentation as the enclosing multi-line blocks!
     #       Note that "       " and "\t" are different, although they may
     #       look the same in an editor!
-    _s = re.escape(_block_start) + "\s*"
-    _e = "\s*" + re.escape(_block_end)
-    _strBlock = r"""
-                    ^(?P<mEnd>[ \t]*)%send%s(?P<meIgnored>.*)\r?\n?   # multi-line end  (^   <!--(end)-->IGNORED_TEXT\n)
-                    |
-                    (?P<sEnd>)%send%s                               # single-line end (<!--(end)-->)
-                    |
-                    (?P<sSpace>[ \t]*)                              # single-line tag (no nesting)
-                    %s(?P<sKeyw>\w+)[ \t]*(?P<sParam>.*?)%s
-                    (?P<sContent>.*?)
-                    (?=(?:%s.*?%s.*?)??%send%s)                     # (match until end or i.e. <!--(elif/else...)-->)
-                    |
-                                                                    # multi-line tag, nested by whitespace indentation
-                    ^(?P<indent>[ \t]*)                             #   save indentation of start tag
-                    %s(?P<mKeyw>\w+)\s*(?P<mParam>.*?)%s(?P<mIgnored>.*)\r?\n
-                    (?P<mContent>(?:.*\n)*?)
-                    (?=(?P=indent)%s(?:.|\s)*?%s)                   #   match indentation
-                """ % (_s, _e,
-                       _s, _e,
-                       _s, _e, _s, _e, _s, _e,
-                       _s, _e, _s, _e)
-    _reBlock = re.compile(_strBlock, re.X|re.M)
+
 
     # "for"-block parameters: "var(,var)* in ..."
     _strForParam = r"""^(?P<names>\w+(?:\s*,\s*\w+)*)\s+in\s+(?P<iter>.+)$"""
@@ -482,7 +1027,7 @@ class Parser(object):
     _reMacroParam = re.compile(r"""^\w+$""")
 
 
-    def __init__(self, loadfunc=None, testexpr=None, escape=HTML):
+    def __init__(self, loadfunc=None, testexpr=None, escape=HTML, includes=None, positions=None):
         """Init the parser.
 
         :Parameters:
@@ -491,6 +1036,14 @@ class Parser(object):
             - `testexpr`: function to test if a template-expressions is valid
               (i.e. ``EvalPseudoSandbox().compile``)
             - `escape`:   default-escaping (may be modified by the template)
+            - `includes`: dictionary to cache the parse-trees of included
+              templates in, may be shared by several parsers using the
+              same `loadfunc` (see `TemplateRegistry`)
+            - `positions`: dictionary to record the source-positions of
+              the parse-tree-nodes in (except for strings), as
+              ``{id(node): (node, (filename,row,col))}`` (see
+              `ProfilingRenderer`); included templates taken from
+              `includes` have no positions
         :Exceptions:
             - `ValueError`: if `testexpr` or `escape` is invalid.
         """
@@ -511,11 +1064,17 @@ class Parser(object):
         if escape not in ESCAPE_SUPPORTED.values():
             raise ValueError("Unsupported 'escape' (%s)." %(escape))
         self.escape = escape
+        self._includes = includes
+        self.positions = positions
         self._includestack = []
+        self.dependencies = set()
 
     def parse(self, template):
         """Parse a template.
 
+        The filenames of all (directly or indirectly) included templates
+        are afterwards in ``dependencies``.
+
         :Parameters:
             - `template`: template-unicode-string
         :Returns:         the resulting parse-tree
@@ -525,13 +1084,47 @@ class Parser(object):
             - `TemplateException`
         """
         self._includestack = [(None, template)]   # for error-messages (_errpos)
+        self.dependencies = set()
         return self._parse(template)
 
+    def _include(self, filename, fpos):
+        """Load and parse an included template.
+
+        Parse-trees are cached in ``includes`` (see `__init__`) by filename
+        and escaping, together with the escaping after the included
+        template and its own dependencies.
+
+        :Returns: the parse-tree of the included template
+        """
+        key = (filename, self.escape)
+        if self._includes is not None  and  key in self._includes:
+            (parsetree, self.escape, dependencies) = self._includes[key]
+        else:
+            try:
+                u = self._load(filename)
+            except Exception,err:
+                raise TemplateIncludeError(err, self._errpos(fpos))
+            self._includestack.append((filename, u))  # current filename/template for error-msg.
+            outer, self.dependencies = self.dependencies, set()
+            parsetree = self._parse(u)
+            self._includestack.pop()
+            dependencies = frozenset(self.dependencies)
+            self.dependencies = outer
+            if self._includes is not None:
+                self._includes[key] = (parsetree, self.escape, dependencies)
+        self.dependencies.add(filename)
+        self.dependencies.update(dependencies)
+        return parsetree
+
     def _errpos(self, fpos):
         """Convert `fpos` to ``(filename,row,column)`` for error-messages."""
         filename, string = self._includestack[-1]
         return filename, srow(string, fpos), scol(string, fpos)
 
+    def _position(self, node, fpos):
+        """Record the position of a node (see `__init__`)."""
+        self.positions[id(node)] = (node, self._errpos(fpos))
+
     def _testexpr(self, expr,  fpos=0):
         """Test a template-expression to detect errors."""
         try:
@@ -539,50 +1132,103 @@ class Parser(object):
         except SyntaxError,err:
             raise TemplateSyntaxError(err, self._errpos(fpos))
 
+    def _substitutions(self, text):
+        """Find the substitutions in `text`.
+
+        A substitution is ``start-tag expr end-tag``, where whitespace
+        around ``expr`` is ignored and ``expr`` is single-line. If the
+        end-tag is missing, the substitution ends at the end of the line.
+
+        This is done by a loop instead of a regexp like
+        ``{{\s*(.*?)\s*(}}|$)``, since the regexp needs O(n^2) for
+        unclosed substitutions with long whitespace-runs.
+
+        :Returns: generator of ``(start, end, start-tag, expr, closed)``
+        """
+        n = len(text)
+        match = self._reSubStart.search(text)
+        while match is not None:
+            start, tag = match.start(), match.group()
+            end_tag = self._sub_end if tag == self._sub_start else self._subesc_end
+            find = self._reSubNext[tag].search
+            w = x = self._reWs.match(text, match.end()).end()     # start of expr
+            while True:                     # find end of expr
+                m = find(text, x)
+                if m is None:               # end of text
+                    end, expr, closed = n, text[w:], False
+                    break
+                x = m.start()
+                if m.group() == end_tag:
+                    end, expr, closed = x + len(end_tag), text[w:x], True
+                    break
+                ws_end = self._reWs.match(text, x).end()
+                if text.startswith(end_tag, ws_end):
+                    end, expr, closed = ws_end + len(end_tag), text[w:x], True
+                    break
+                if ws_end == n:
+                    end, expr, closed = n, text[w:x], False
+                    break
+                eol = text.rfind("\n", x, ws_end)
+                if eol >= 0:
+                    end, expr, closed = eol, text[w:x], False
+                    break
+                x = ws_end
+            yield start, end, tag, expr, closed
+            match = self._reSubStart.search(text, end)
+
     def _parse_sub(self, parsetree, text, fpos=0):
         """Parse substitutions, and append them to the parse-tree.
         
         Additionally, remove comments.
         """
         curr = 0
-        for match in self._reSubstitution.finditer(text):
-            start = match.start()
+        for start, end, tag, expr, closed in self._substitutions(text):
             if start > curr:
                 parsetree.append(("str", self._reComment.sub('', text[curr:start])))
 
-            if match.group("sub") is not None:
-                if not match.group("end"):
+            if tag == self._sub_start:
+                if not closed:
                     raise TemplateSyntaxError("Missing closing tag '%s' for '%s'." 
-                            % (self._sub_end, match.group()), self._errpos(fpos+start))
-                if len(match.group("sub")) > 0:
-                    self._testexpr(match.group("sub"), fpos+start)
-                    parsetree.append(("sub", match.group("sub")))
+                            % (self._sub_end, text[start:end]), self._errpos(fpos+start))
+                if len(expr) > 0:
+                    self._testexpr(expr, fpos+start)
+                    node = ("sub", expr)
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, fpos+start)
             else:
-                assert(match.group("escsub") is not None)
-                if not match.group("escend"):
+                if not closed:
                     raise TemplateSyntaxError("Missing closing tag '%s' for '%s'."
-                            % (self._subesc_end, match.group()), self._errpos(fpos+start))
-                if len(match.group("escsub")) > 0:
-                    self._testexpr(match.group("escsub"), fpos+start)
-                    parsetree.append(("esc", self.escape, match.group("escsub")))
+                            % (self._subesc_end, text[start:end]), self._errpos(fpos+start))
+                if len(expr) > 0:
+                    self._testexpr(expr, fpos+start)
+                    node = ("esc", self.escape, expr)
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, fpos+start)
 
-            curr = match.end()
+            curr = end
 
         if len(text) > curr:
             parsetree.append(("str", self._reComment.sub('', text[curr:])))
 
-    def _parse(self, template, fpos=0):
+    def _parse(self, template, fpos=0, lexer=None, lpos=0):
         """Recursive part of `parse()`.
         
         :Parameters:
             - template
             - fpos: position of ``template`` in the complete template (for error-messages)
+            - lexer: `_BlockLexer` of the enclosing template, or None
+            - lpos: position of ``template`` in ``lexer.template``
         """
-        # blank out comments
-        # (So that its content does not collide with other syntax, and
-        #  because removing them completely would falsify the character-
-        #  position ("match.start()") of error-messages)
-        template = self._reComment.sub(lambda match: self._comment_start+" "*len(match.group(1))+match.group(2), template)
+        if lexer is None:
+            # blank out comments
+            # (So that its content does not collide with other syntax, and
+            #  because removing them completely would falsify the character-
+            #  position ("match.start()") of error-messages)
+            # (Block-contents are already blanked.)
+            template = self._reComment.sub(lambda match: self._comment_start+" "*len(match.group(1))+match.group(2), template)
+            lexer = _BlockLexer(template, self._block_start, self._block_end)
 
         # init parser
         parsetree = []
@@ -590,134 +1236,144 @@ class Parser(object):
         block_type = None   # block type: if,for,macro,raw,...
         block_indent = None # None: single-line, >=0: multi-line
 
+        off = fpos - lpos   # lexer-position -> position in the complete template
+
         # find blocks
-        for match in self._reBlock.finditer(template):
-            start = match.start()
+        for block in lexer.blocks(lpos, lpos + len(template)):
+            start = block.start - lpos
             # process template-part before this block
             if start > curr:
                 self._parse_sub(parsetree, template[curr:start], fpos)
 
             # analyze block syntax (incl. error-checking and -messages)
             keyword = None
-            block = match.groupdict()
+            block_str = template[start:block.end-lpos]
             pos__ = fpos + start                # shortcut
-            if   block["sKeyw"] is not None:    # single-line block tag
+            if   block.kind == "single":        # single-line block tag
                 block_indent = None
-                keyword = block["sKeyw"]
-                param   = block["sParam"]
-                content = block["sContent"]
-                if block["sSpace"]:             # restore spaces before start-tag
+                keyword = block.keyword
+                param   = block.param
+                content = block.content
+                if block.indent:                # restore spaces before start-tag
                     if len(parsetree) > 0 and parsetree[-1][0] == "str":
-                        parsetree[-1] = ("str", parsetree[-1][1] + block["sSpace"])
+                        parsetree[-1] = ("str", parsetree[-1][1] + block.indent)
                     else:
-                        parsetree.append(("str", block["sSpace"]))
-                pos_p = fpos + match.start("sParam")    # shortcuts
-                pos_c = fpos + match.start("sContent")
-            elif block["mKeyw"] is not None:    # multi-line block tag
-                block_indent = len(block["indent"])
-                keyword = block["mKeyw"]
-                param   = block["mParam"]
-                content = block["mContent"]
-                pos_p = fpos + match.start("mParam")
-                pos_c = fpos + match.start("mContent")
-                ignored = block["mIgnored"].strip()
+                        parsetree.append(("str", block.indent))
+                pos_p = off + block.param_pos       # shortcuts
+                pos_c = off + block.content_pos
+            elif block.kind == "multi":         # multi-line block tag
+                block_indent = len(block.indent)
+                keyword = block.keyword
+                param   = block.param
+                content = block.content
+                pos_p = off + block.param_pos
+                pos_c = off + block.content_pos
+                ignored = block.ignored.strip()
                 if ignored  and  ignored != self._comment_start:
-                    raise TemplateSyntaxError("No code allowed after block-tag.", self._errpos(fpos+match.start("mIgnored")))
-            elif block["mEnd"] is not None:     # multi-line block end
+                    raise TemplateSyntaxError("No code allowed after block-tag.", self._errpos(off+block.ignored_pos))
+            elif block.kind == "mEnd":          # multi-line block end
                 if block_type is None:
                     raise TemplateSyntaxError("No block to end here/invalid indent.", self._errpos(pos__) )
-                if block_indent != len(block["mEnd"]):
+                if block_indent != len(block.indent):
                     raise TemplateSyntaxError("Invalid indent for end-tag.", self._errpos(pos__) )
-                ignored = block["meIgnored"].strip()
+                ignored = block.ignored.strip()
                 if ignored  and  ignored != self._comment_start:
-                    raise TemplateSyntaxError("No code allowed after end-tag.", self._errpos(fpos+match.start("meIgnored")))
+                    raise TemplateSyntaxError("No code allowed after end-tag.", self._errpos(off+block.ignored_pos))
                 block_type = None
-            elif block["sEnd"] is not None:     # single-line block end
+            elif block.kind == "sEnd":          # single-line block end
                 if block_type is None:
                     raise TemplateSyntaxError("No block to end here/invalid indent.", self._errpos(pos__))
                 if block_indent is not None:
                     raise TemplateSyntaxError("Invalid indent for end-tag.", self._errpos(pos__))
                 block_type = None
             else:
-                raise TemplateException("FATAL: Block regexp error. Please contact the author. (%s)" % match.group())
+                raise TemplateException("FATAL: Block lexer error. Please contact the author. (%s)" % block_str)
 
             # analyze block content (mainly error-checking and -messages)
             if keyword:
                 keyword = keyword.lower()
                 if   'for'   == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block at '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'for'
                     cond = self._reForParam.match(param)
                     if cond is None:
                         raise TemplateSyntaxError("Invalid 'for ...' at '%s'." %(param), self._errpos(pos_p))
                     names = tuple(n.strip()  for n in cond.group("names").split(","))
                     self._testexpr(cond.group("iter"), pos_p+cond.start("iter"))
-                    parsetree.append(("for", names, cond.group("iter"), self._parse(content, pos_c)))
+                    node = ("for", names, cond.group("iter"), self._parse(content, pos_c, lexer, block.content_pos))
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, pos__)
                 elif 'if'    == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block at '%s'." %(block_str), self._errpos(pos__))
                     if not param:
-                        raise TemplateSyntaxError("Missing condition for 'if' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing condition for 'if' at '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'if'
                     self._testexpr(param, pos_p)
-                    parsetree.append(("if", param, self._parse(content, pos_c)))
+                    node = ("if", param, self._parse(content, pos_c, lexer, block.content_pos))
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, pos__)
                 elif 'elif'  == keyword:
                     if block_type != 'if':
-                        raise TemplateSyntaxError("'elif' may only appear after 'if' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("'elif' may only appear after 'if' at '%s'." %(block_str), self._errpos(pos__))
                     if not param:
-                        raise TemplateSyntaxError("Missing condition for 'elif' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing condition for 'elif' at '%s'." %(block_str), self._errpos(pos__))
                     self._testexpr(param, pos_p)
-                    parsetree.append(("elif", param, self._parse(content, pos_c)))
+                    node = ("elif", param, self._parse(content, pos_c, lexer, block.content_pos))
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, pos__)
                 elif 'else'  == keyword:
                     if block_type not in ('if', 'for'):
-                        raise TemplateSyntaxError("'else' may only appear after 'if' of 'for' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("'else' may only appear after 'if' of 'for' at '%s'." %(block_str), self._errpos(pos__))
                     if param:
-                        raise TemplateSyntaxError("'else' may not have parameters at '%s'." %(match.group()), self._errpos(pos__))
-                    parsetree.append(("else", self._parse(content, pos_c)))
+                        raise TemplateSyntaxError("'else' may not have parameters at '%s'." %(block_str), self._errpos(pos__))
+                    node = ("else", self._parse(content, pos_c, lexer, block.content_pos))
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, pos__)
                 elif 'macro' == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'macro'
                     # make sure param is "\w+" (instead of ".+")
                     if not param:
-                        raise TemplateSyntaxError("Missing name for 'macro' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing name for 'macro' at '%s'." %(block_str), self._errpos(pos__))
                     if not self._reMacroParam.match(param):
-                        raise TemplateSyntaxError("Invalid name for 'macro' at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Invalid name for 'macro' at '%s'." %(block_str), self._errpos(pos__))
                     #remove last newline
                     if len(content) > 0 and content[-1] == '\n':
                         content = content[:-1]
                     if len(content) > 0 and content[-1] == '\r':
                         content = content[:-1]
-                    parsetree.append(("macro", param, self._parse(content, pos_c)))
+                    node = ("macro", param, self._parse(content, pos_c, lexer, block.content_pos))
+                    parsetree.append(node)
+                    if self.positions is not None:
+                        self._position(node, pos__)
 
                 # parser-commands
                 elif 'raw'   == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(block_str), self._errpos(pos__))
                     if param:
-                        raise TemplateSyntaxError("'raw' may not have parameters at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("'raw' may not have parameters at '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'raw'
                     parsetree.append(("str", content))
                 elif 'include' == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(block_str), self._errpos(pos__))
                     if param:
-                        raise TemplateSyntaxError("'include' may not have parameters at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("'include' may not have parameters at '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'include'
-                    try:
-                        u = self._load(content.strip())
-                    except Exception,err:
-                        raise TemplateIncludeError(err, self._errpos(pos__))
-                    self._includestack.append((content.strip(), u))  # current filename/template for error-msg.
-                    p = self._parse(u)
-                    self._includestack.pop()
-                    parsetree.extend(p)
+                    parsetree.extend(self._include(content.strip(), pos__))
                 elif 'set_escape' == keyword:
                     if block_type is not None:
-                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("Missing block-end-tag before new block '%s'." %(block_str), self._errpos(pos__))
                     if param:
-                        raise TemplateSyntaxError("'set_escape' may not have parameters at '%s'." %(match.group()), self._errpos(pos__))
+                        raise TemplateSyntaxError("'set_escape' may not have parameters at '%s'." %(block_str), self._errpos(pos__))
                     block_type = 'set_escape'
                     esc = content.strip().upper()
                     if esc not in ESCAPE_SUPPORTED:
@@ -725,7 +1381,7 @@ class Parser(object):
                     self.escape = ESCAPE_SUPPORTED[esc]
                 else:
                     raise TemplateSyntaxError("Invalid keyword '%s'." %(keyword), self._errpos(pos__))
-            curr = match.end()
+            curr = block.end - lpos
 
         if block_type is not None:
             raise TemplateSyntaxError("Missing end-tag.", self._errpos(pos__))
@@ -735,9 +1391,438 @@ class Parser(object):
 
         return parsetree
 
+#-----------------------------------------
+# Optimizer
+
+class Optimizer(object):
+    """Optimize a parse-tree, before it is rendered.
+
+    - merge adjacent strings, and remove empty strings
+    - fold constant expressions (i.e. ``{{ "-" * 40 }}``) into strings
+    - fold 'if'/'elif'/'else'-blocks with constant conditions
+
+    Only expressions without any names (no variables, functions or
+    attributes) are constant, so they can be evaluated without side-effects.
+    They are only folded if the size of their result is known to be at most
+    `max_fold` before evaluating them (see `_size()`), so an expression like
+    ``[1] * 10**9`` is left to the renderer (and its `RenderLimits`).
+    The optimized parse-tree renders exactly like the original one.
+
+    The number of removed nodes is counted in ``removed``.
+    """
+
+    def __init__(self, escapefunc=escape):
+        """Init the optimizer.
+
+        :Parameters:
+            - `escapefunc`: function for escaping special characters
+              (i.e. `escape`), must be the one used by the renderer
+        """
+        self.escapefunc = escapefunc
+        self.removed = 0
+
+    #: max. size of folded values (characters, items or digits)
+    max_fold = 10000
+
+    @classmethod
+    def count(cls, parsetree):
+        """Count the nodes of a parse-tree, incl. the nested ones."""
+        n = len(parsetree)
+        for elem in parsetree:
+            if elem[0] in ("for", "if", "elif", "else", "macro"):
+                n += cls.count(elem[-1])
+        return n
+
+    def optimize(self, parsetree):
+        """Optimize a parse-tree.
+
+        :Returns: the optimized parse-tree (the original one is not modified)
+        """
+        optimized = self._optimize(parsetree)
+        self.removed += self.count(parsetree) - self.count(optimized)
+        return optimized
+
+    def _constant(self, expr):
+        """Evaluate an expression, if it is constant.
+
+        :Returns: ``(True, value)``, or ``(False, None)`` if `expr` is not
+                  constant or cannot be evaluated here (the error then
+                  occurs when rendering, as before)
+        """
+        # (checked before compiling, since compile() already evaluates some
+        # constant parts; names, lambdas etc. have no size)
+        try:
+            if self._size(ast.parse(expr.strip(), mode="eval").body)[1] is None:
+                return (False, None)
+            code = compile(expr, "<string>", "eval")
+        except SyntaxError:
+            return (False, None)
+        try:
+            return (True, eval(code, {"__builtins__": {}}))
+        except Exception:
+            return (False, None)
+
+    @staticmethod
+    def _integer(node):
+        """Test if an expression-node is an integer literal."""
+        return isinstance(node, ast.Num) and isinstance(node.n, (int, long))
+
+    def _size(self, node):
+        """Estimate the size of the value of a constant expression.
+
+        The size is an upper bound of the length of a string or sequence,
+        or of the number of digits of a number; it is estimated from the
+        literals and operators only, without evaluating anything.
+
+        :Returns: ``(kind, size)``, with kind "num", "str", "seq" or None
+                  (unknown), and size None if it is unknown or larger
+                  than `max_fold`
+        """
+        kind, size = None, None
+        if isinstance(node, ast.Num):
+            kind, size = "num", len(repr(node.n))
+        elif isinstance(node, ast.Str):
+            kind, size = "str", len(node.s)
+        elif isinstance(node, (ast.Tuple, ast.List, ast.Dict)):
+            items = isinstance(node, ast.Dict) and (node.keys + node.values) or node.elts
+            sizes = [self._size(item)[1] for item in items]
+            if None not in sizes:
+                kind, size = "seq", sum(sizes) + len(sizes)
+        elif isinstance(node, ast.UnaryOp):
+            kind, size = self._size(node.operand)
+            if isinstance(node.op, ast.Not):
+                kind = "num"
+        elif isinstance(node, (ast.BoolOp, ast.Compare, ast.IfExp)):
+            if isinstance(node, ast.BoolOp):
+                values = node.values
+            elif isinstance(node, ast.Compare):
+                values = [node.left] + node.comparators
+            else:
+                values = [node.test, node.body, node.orelse]
+            sized = [self._size(value) for value in values]
+            if None not in [s for (k, s) in sized]:
+                kinds = set([k for (k, s) in sized])
+                kind, size = len(kinds) == 1 and kinds.pop() or None, max([s for (k, s) in sized])
+                if isinstance(node, ast.Compare):
+                    kind, size = "num", 1
+        elif isinstance(node, ast.BinOp):
+            (lkind, lsize), (rkind, rsize) = self._size(node.left), self._size(node.right)
+            if lsize is None or rsize is None:
+                return (None, None)
+            op = node.op
+            if isinstance(op, (ast.Add, ast.Sub, ast.BitOr, ast.BitAnd, ast.BitXor)):
+                kind, size = lkind == rkind and lkind or None, lsize + rsize
+            elif isinstance(op, (ast.Div, ast.FloorDiv, ast.Mod)):
+                # (no string-formatting, which may pad to any width)
+                if lkind == rkind == "num":
+                    kind, size = "num", lsize + rsize
+            elif isinstance(op, ast.Mult):
+                if lkind == rkind == "num":
+                    kind, size = "num", lsize + rsize
+                elif lkind in ("str", "seq") and self._integer(node.right):
+                    kind, size = lkind, lsize * max(node.right.n, 0)
+                elif rkind in ("str", "seq") and self._integer(node.left):
+                    kind, size = rkind, rsize * max(node.left.n, 0)
+            elif isinstance(op, ast.Pow):
+                if isinstance(node.left, ast.Num) and self._integer(node.right):
+                    kind, size = "num", lsize * abs(node.right.n) + 1
+            elif isinstance(op, ast.LShift):
+                if lkind == "num" and self._integer(node.right):
+                    kind, size = "num", lsize + abs(node.right.n) // 3 + 1
+            elif isinstance(op, ast.RShift):
+                if lkind == rkind == "num":
+                    kind, size = "num", lsize
+        if size is None or size > self.max_fold:
+            return (None, None)
+        return (kind, size)
+
+    def _optimize(self, parsetree):
+        """Recursive part of `optimize()`."""
+        result = []
+        chain = None    # state of the current if/elif/else-chain:
+                        #  None (no chain), "open", "taken" (a constant-true
+                        #  branch was inlined), "dropped" (all branches were
+                        #  constant-false until now)
+
+        def add_str(u):
+            if not u:
+                pass
+            elif result and result[-1][0] == "str":
+                result[-1] = ("str", result[-1][1] + u)
+            else:
+                result.append(("str", u))
+
+        def inline(parsetree):
+            for e in self._optimize(parsetree):
+                if e[0] == "str":
+                    add_str(e[1])
+                else:
+                    result.append(e)
+
+        for elem in parsetree:
+            if   "str"   == elem[0]:
+                add_str(elem[1])
+            elif "sub"   == elem[0] or "esc" == elem[0]:
+                (const, value) = self._constant(elem[-1])
+                try:
+                    if not const:
+                        result.append(elem)
+                    elif "sub" == elem[0]:
+                        add_str(unicode(value))
+                    else:
+                        add_str(self.escapefunc(unicode(value), elem[1]))
+                except UnicodeError:
+                    result.append(elem)
+            elif "for"   == elem[0]:
+                chain = None
+                result.append(elem[:3] + (self._optimize(elem[3]),))
+            elif "if"    == elem[0]  or  ("elif" == elem[0] and chain == "dropped"):
+                (const, value) = self._constant(elem[1])
+                if not const:
+                    chain = "open"
+                    result.append(("if", elem[1], self._optimize(elem[2])))
+                elif value:
+                    chain = "taken"
+                    inline(elem[2])
+                else:
+                    chain = "dropped"
+            elif "elif"  == elem[0]:
+                if chain == "taken":
+                    continue
+                (const, value) = self._constant(elem[1])
+                if not const:
+                    result.append(("elif", elem[1], self._optimize(elem[2])))
+                elif value:
+                    chain = "taken"
+                    result.append(("else", self._optimize(elem[2])))
+            elif "else"  == elem[0]:
+                if chain == "taken":
+                    pass
+                elif chain == "dropped":
+                    inline(elem[1])
+                else:
+                    result.append(("else", self._optimize(elem[1])))
+                chain = None
+            elif "macro" == elem[0]:
+                result.append(("macro", elem[1], self._optimize(elem[2])))
+            else:
+                raise TemplateException("Invalid parse-tree (%s)." %(elem,))
+        return result
+
+#-----------------------------------------
+# Limits
+
+class RenderLimits(object):
+    """Resource-limits for rendering a template.
+
+    Templates may come from users (i.e. attribution-settings), and a
+    template like ``{% for i in range(10**8) %}`` would block the
+    rendering thread. If a limit is exceeded, rendering is aborted with a
+    `TemplateRenderError`. All limits are optional (None: no limit), and
+    apply to every rendering separately, incl. all macros called by it.
+
+    - `max_iterations`: max. number of loop-iterations (of all 'for'-blocks
+      together) and macro-calls, and max. length of lists created by
+      ``range()``/``xrange()`` in expressions
+    - `max_output`: max. length of the output (in characters); the output
+      of a macro is counted where it is output, not in the macro-body (so
+      it is not counted again by every macro it is passed through)
+    - `max_time`: max. time for rendering (in seconds); it is checked
+      between the parts of the output, so a single slow expression (or
+      object) is not interrupted
+
+    :Note: Expressions are evaluated before their result is checked, so
+           the limits cannot prevent a single huge result (i.e.
+           ``"x" * 10**9``) from being created, but it is not rendered.
+
+    Example:
+
+        >>> limits = RenderLimits(max_output=5)
+        >>> t = Template(u"{% macro a %}abcde{% end %}{% macro b %}{{ a() }}{% end %}{{ b() }}", limits=limits)
+        >>> t()
+        u'abcde'
+        >>> u"".join(t.iter_render())
+        u'abcde'
+        >>> Template(u"{{ b() }}{{ b() }}", limits=limits)(b=t)
+        Traceback (most recent call last):
+          ...
+        TemplateRenderError: Output too long (max. 5 characters).
+    """
+    __slots__ = ['max_iterations', 'max_output', 'max_time']
+
+    def __init__(self, max_iterations=None, max_output=None, max_time=None):
+        self.max_iterations = max_iterations
+        self.max_output     = max_output
+        self.max_time       = max_time
+
+    def __repr__(self):
+        return "RenderLimits(max_iterations=%r, max_output=%r, max_time=%r)" % (
+                self.max_iterations, self.max_output, self.max_time)
+
+class _Budget(object):
+    """The resources left for one rendering (see `RenderLimits`).
+
+    Kept in the data-namespace of the rendering (``Scope.budget``), so it
+    is shared by all loops and macros of the rendering.
+    """
+    __slots__ = ['limits', 'iterations', 'output', 'deadline']
+
+    def __init__(self, limits):
+        self.limits     = limits
+        self.iterations = limits.max_iterations
+        self.output     = limits.max_output
+        self.deadline   = None
+        if limits.max_time is not None:
+            self.deadline = _timer() + limits.max_time
+
+    def iteration(self):
+        """Count a loop-iteration.
+
+        :Exceptions:
+            - `TemplateRenderError`: if a limit is exceeded
+        """
+        if self.iterations is not None:
+            self.iterations -= 1
+            if self.iterations < 0:
+                raise TemplateRenderError("Too many loop-iterations (max. %d)." % self.limits.max_iterations)
+        if self.deadline is not None and _timer() > self.deadline:
+            raise TemplateRenderError("Rendering took too long (max. %g seconds)." % self.limits.max_time)
+
+    def out(self, s):
+        """Count output.
+
+        :Returns: `s`
+        :Exceptions:
+            - `TemplateRenderError`: if a limit is exceeded
+        """
+        if self.output is not None:
+            self.output -= len(s)
+            if self.output < 0:
+                raise TemplateRenderError("Output too long (max. %d characters)." % self.limits.max_output)
+        if self.deadline is not None and _timer() > self.deadline:
+            raise TemplateRenderError("Rendering took too long (max. %g seconds)." % self.limits.max_time)
+        return s
+
+    def macro(self):
+        """Get the budget for the body of a macro (see `_MacroBudget`)."""
+        return _MacroBudget(self)
+
+class _MacroBudget(object):
+    """The budget of a macro-body.
+
+    Loop-iterations and time are counted by the budget of the rendering,
+    but not the output, since the result of the macro is counted where it
+    is output.
+    """
+    __slots__ = ['budget']
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def iteration(self):
+        """Count a loop-iteration. (see `_Budget.iteration`)"""
+        self.budget.iteration()
+
+    def out(self, s):
+        """Check the time only. (see `_Budget.out`)"""
+        self.budget.out(u"")
+        return s
+
+    def macro(self):
+        return self
+
+def _budget(limits, data):
+    """Get the `_Budget` of the rendering of `data`.
+
+    Starts a new budget if there is none yet, i.e. when a template is
+    rendered (and not one of its blocks or macros).
+    """
+    budget = getattr(data, "budget", None)
+    if budget is None:
+        budget = _Budget(limits)
+        if isinstance(data, Scope):
+            data.budget = budget
+    return budget
+
 #-----------------------------------------
 # Evaluation
 
+_CO_OPTIMIZED = 0x0001      # code-flag of functions (see inspect.CO_OPTIMIZED)
+
+class CompileCache:
+    """Size-bounded LRU-cache of compiled expressions.
+
+    Shared by all `EvalPseudoSandbox` instances (see
+    ``EvalPseudoSandbox.shared_cache``), so that an expression is only
+    compiled once, even if it is used in many templates, while the memory
+    used stays bounded. It is thread-safe.
+
+    Counters: ``hits``, ``misses``, ``evictions`` and ``bytes`` (estimated
+    size of the cached expressions and code-objects).
+    """
+    def __init__(self, maxsize=1000):
+        """
+        :Parameters:
+            - `maxsize`: max. number of cached expressions
+        """
+        self.maxsize    = maxsize
+        self._cache     = collections.OrderedDict()   # expr -> (code, size), least recently used first
+        self._lock      = threading.Lock()
+        self.hits       = 0
+        self.misses     = 0
+        self.evictions  = 0
+        self.bytes      = 0
+
+    @staticmethod
+    def _sizeof(expr, code):
+        """Estimate the memory used by an expression and its code-object."""
+        return (sys.getsizeof(expr) + sys.getsizeof(code) + sys.getsizeof(code.co_code)
+                + sum([sys.getsizeof(c) for c in code.co_consts]))
+
+    def get(self, expr):
+        """Get the compiled `expr`, or None if it is not cached."""
+        with self._lock:
+            try:
+                entry = self._cache.pop(expr)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._cache[expr] = entry       # most recently used
+            self.hits += 1
+            return entry[0]
+
+    def put(self, expr, code):
+        """Add a compiled `expr` to the cache, evicting the least recently used ones."""
+        size = self._sizeof(expr, code)
+        with self._lock:
+            old = self._cache.pop(expr, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._cache[expr] = (code, size)
+            self.bytes += size
+            while len(self._cache) > self.maxsize:
+                (_, (_, size)) = self._cache.popitem(last=False)
+                self.bytes -= size
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all expressions from the cache (the counters are kept)."""
+        with self._lock:
+            self._cache.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self):
+        """Get the counters.
+
+        :Returns: dict with size, maxsize, hits, misses, evictions, bytes
+        """
+        with self._lock:
+            return dict(size=len(self._cache), maxsize=self.maxsize, hits=self.hits,
+                        misses=self.misses, evictions=self.evictions, bytes=self.bytes)
+
 # some checks
 assert len(eval("dir()", {'__builtins__':{'dir':dir}})) == 1, \
     "FATAL: 'eval' does not work as expected (%s)."
@@ -759,6 +1844,11 @@ class EvalPseudoSandbox:
     This is to prevent things like '0 .__class__', with which you could
     easily break out of a "sandbox".
 
+    The sandbox does not keep any state while evaluating, so it can be used
+    by several threads at the same time: exists(), default(), setvar() and
+    import find the data-namespace in the frame of the sandboxed expression,
+    which called them (see `_locals`).
+
     Be careful to only pass "safe" objects/functions to the template,
     because any unsafe function/method could break the sandbox!
     For maximum security, restrict the access to as few objects/functions
@@ -811,14 +1901,31 @@ class EvalPseudoSandbox:
         "xrange"    : __builtin__.xrange,
     }
 
-    def __init__(self):
-        self._compile_cache = {}
-        self.locals_ptr = None
+    # compiled expressions, shared by all sandboxes
+    shared_cache = CompileCache()
+
+    # simple expressions: a name, or a chain of attributes (see `path`)
+    _rePath = re.compile(r"^[A-Za-z]\w*(?:\.[A-Za-z]\w*)*$")
+
+    def __init__(self, limits=None):
+        """
+        :Parameters:
+            - `limits`: `RenderLimits`; ``range()`` and ``xrange()`` are
+              restricted to ``limits.max_iterations`` items
+        """
+        self._compile_cache = {}    # the compiled expressions of this sandbox
+        self._paths = {}            # expr -> (name, getattrs) or None (see `path`)
         self.eval_allowed_globals = self.safe_builtins.copy()
+        self._globals = {"__builtins__": self.eval_allowed_globals}
         self.register("__import__", self.f_import)
         self.register("exists",  self.f_exists)
         self.register("default", self.f_default)
         self.register("setvar",  self.f_setvar)
+        self.max_items = None
+        if limits is not None  and  limits.max_iterations is not None:
+            self.max_items = limits.max_iterations
+            self.register("range",  self.f_range)
+            self.register("xrange", self.f_xrange)
 
     def register(self, name, obj):
         """Add an object to the "allowed eval-globals".
@@ -830,7 +1937,7 @@ class EvalPseudoSandbox:
     def compile(self, expr):
         """Compile a python-eval-expression.
 
-        - Use a compile-cache.
+        - Use a compile-cache (and the `shared_cache`).
         - Raise a `NameError` if `expr` contains a name beginning with ``_``.
         
         :Returns: the compiled `expr`
@@ -838,25 +1945,176 @@ class EvalPseudoSandbox:
             - `SyntaxError`: for compile-errors
             - `NameError`: if expr contains a name beginning with ``_``
         """
-        if expr not in self._compile_cache:
+        try:
+            return self._compile_cache[expr]
+        except KeyError:
+            pass
+        c = self.shared_cache.get(expr)
+        if c is None:
             c = compile(expr, "", "eval")
             for i in c.co_names:    #prevent breakout via new-style-classes
                 if i[0] == '_':
                     raise NameError("Name '%s' is not allowed." %(i))
-            self._compile_cache[expr] = c
-        return self._compile_cache[expr]
+            self.shared_cache.put(expr, c)
+        self._compile_cache[expr] = c
+        return c
+
+    def compiled(self):
+        """Get the compiled expressions of the compile-cache.
+
+        :Returns: ``{expr: code}``
+        """
+        return dict(self._compile_cache)
+
+    def add_compiled(self, codes):
+        """Add expressions compiled before (see `compiled()`) to the compile-cache.
+
+        The code-objects (i.e. loaded from a `ParseTreeCache`-file) are
+        checked like compiled ones (see `_check_code`); the ones failing
+        the checks are ignored, and compiled again when needed. They are
+        only added to the compile-cache of this sandbox, not to the
+        `shared_cache`.
+        """
+        for (expr, code) in codes.iteritems():
+            if isinstance(expr, basestring)  and  self._check_code(code):
+                self._compile_cache[expr] = code
+
+    # operations allowed in code-objects not compiled by `compile` (all
+    # except the ones which compiled expressions never need)
+    _allowed_opcodes = frozenset(opcode.opmap.values()) - frozenset([opcode.opmap[name] for name in (
+        "IMPORT_NAME", "IMPORT_FROM", "IMPORT_STAR", "EXEC_STMT", "LOAD_LOCALS",
+        "BUILD_CLASS", "STORE_GLOBAL", "DELETE_GLOBAL", "DELETE_ATTR", "EXTENDED_ARG")])
+
+    @classmethod
+    def _check_code(cls, code):
+        """Check a code-object which was not compiled by `compile`.
+
+        Like `compile`, it rejects names beginning with ``_``, also in the
+        nested code-objects (i.e. of lambdas); and it rejects unknown or
+        forbidden operations, and arguments out of range.
+
+        :Returns: True if the code-object may be evaluated
+        """
+        if not isinstance(code, types.CodeType):
+            return False
+        for name in code.co_names:
+            if name[:1] == "_":
+                return False
+        co_code = code.co_code
+        limits = {}
+        for op in opcode.hasconst:
+            limits[op] = len(code.co_consts)
+        for op in opcode.hasname:
+            limits[op] = len(code.co_names)
+        for op in opcode.haslocal:
+            limits[op] = code.co_nlocals
+        for op in opcode.hasfree:
+            limits[op] = len(code.co_cellvars) + len(code.co_freevars)
+        for op in opcode.hasjabs:
+            limits[op] = len(co_code)
+        i = 0
+        while i < len(co_code):
+            op = ord(co_code[i])
+            if op not in cls._allowed_opcodes:
+                return False
+            if op >= opcode.HAVE_ARGUMENT:
+                if i + 2 >= len(co_code):
+                    return False
+                arg = ord(co_code[i+1]) + ord(co_code[i+2]) * 256
+                if op in limits and arg >= limits[op]:
+                    return False
+                if op in opcode.hasjrel and i + 3 + arg > len(co_code):
+                    return False
+                i += 3
+            else:
+                i += 1
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType)  and  not cls._check_code(const):
+                return False
+        return True
+
+    def path(self, expr):
+        """Check if an expression is a simple one, which can be evaluated
+        without `eval`.
+
+        Simple expressions are names and chains of attributes (i.e.
+        ``message.From.name``); they are compiled first, so the same
+        restrictions apply as for all other expressions.
+        Names of "allowed eval-globals" (i.e. ``len``) are not simple
+        expressions, since they are not found in the data-namespace.
+
+        :Returns: ``(name, getattrs)``, where getattrs is a function to get
+                  the attributes from the object `name` (or None if there
+                  are no attributes); or None if `expr` is not simple
+        :Exceptions:
+            - `SyntaxError`, `NameError`: see `compile`
+        """
+        try:
+            return self._paths[expr]
+        except KeyError:
+            pass
+        path = None
+        names = expr.strip().split(".")
+        if self._rePath.match(expr.strip())  and  names[0] not in self.eval_allowed_globals:
+            # check the byte-code (i.e. "None" is a constant, not a name)
+            ops = [opcode.opmap["LOAD_NAME"]] + [opcode.opmap["LOAD_ATTR"]] * (len(names)-1)
+            if self._opcodes(self.compile(expr)) == ops + [opcode.opmap["RETURN_VALUE"]]:
+                path = (names[0], len(names) > 1 and operator.attrgetter(".".join(names[1:])) or None)
+        self._paths[expr] = path
+        return path
+
+    @staticmethod
+    def _opcodes(code):
+        """Get the operations of a code-object (without their arguments)."""
+        co_code = code.co_code
+        ops = []
+        i = 0
+        while i < len(co_code):
+            op = ord(co_code[i])
+            ops.append(op)
+            i += (op >= opcode.HAVE_ARGUMENT) and 3 or 1
+        return ops
 
     def eval(self, expr, locals):
         """Eval a python-eval-expression.
         
-        Sets ``self.locals_ptr`` to ``locales`` and compiles the code
-        before evaluating.
+        Compiles the code before evaluating, and evaluates it with
+        ``locals`` as data-namespace. Simple expressions (see `path`)
+        are evaluated without `eval` if their name is in ``locals``.
         """
-        sav = self.locals_ptr
-        self.locals_ptr = locals
-        x = eval(self.compile(expr), {"__builtins__":self.eval_allowed_globals}, locals)
-        self.locals_ptr = sav
-        return x
+        try:
+            path = self._paths[expr]
+        except KeyError:
+            path = self.path(expr)
+        if path is not None and locals is not None:
+            try:
+                obj = locals[path[0]]
+            except KeyError:
+                pass
+            else:
+                if path[1] is None:
+                    return obj
+                return path[1](obj)
+        return eval(self.compile(expr), self._globals, locals)
+
+    def _locals(self):
+        """Get the data-namespace of the sandboxed expression, which
+        called a function of the sandbox (i.e. `f_exists`).
+
+        This is the locals-namespace of the nearest calling frame, which
+        is a sandboxed expression (i.e. uses ``eval_allowed_globals``);
+        frames of functions (i.e. lambdas or generator-expressions in
+        the expression) are skipped.
+
+        :Returns: the data-namespace, or None if not called by a
+                  sandboxed expression
+        """
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_builtins is self.eval_allowed_globals  and  not frame.f_code.co_flags & _CO_OPTIMIZED:
+                return frame.f_locals
+            frame = frame.f_back
+        return None
 
     def f_import(self, name, *args, **kwargs):
         """``import``/``__import__()`` for the sandboxed code.
@@ -890,11 +2148,32 @@ class EvalPseudoSandbox:
             # 13:40:54
         """
         import types
-        if self.locals_ptr is not None  and  name in self.locals_ptr  and  isinstance(self.locals_ptr[name], types.ModuleType):
-            return self.locals_ptr[name]
+        locals = self._locals()
+        if locals is not None  and  name in locals  and  isinstance(locals[name], types.ModuleType):
+            return locals[name]
         else:
             raise ImportError("import not allowed in pseudo-sandbox; try to import '%s' yourself and pass it to the sandbox/template" % name)
 
+    def _check_range(self, args):
+        """Raise a `TemplateRenderError` if ``range(*args)`` would have
+        more than `max_items` items."""
+        try:
+            n = len(xrange(*args))
+        except OverflowError:   # (more items than a C long)
+            n = None
+        if n is None  or  n > self.max_items:
+            raise TemplateRenderError("range() too large (max. %d items)." % self.max_items)
+
+    def f_range(self, *args):
+        """``range()`` for the sandboxed code, with at most `max_items` items."""
+        self._check_range(args)
+        return range(*args)
+
+    def f_xrange(self, *args):
+        """``xrange()`` for the sandboxed code, with at most `max_items` items."""
+        self._check_range(args)
+        return xrange(*args)
+
     def f_exists(self, varname):
         """``exists()`` for the sandboxed code.
         
@@ -907,7 +2186,7 @@ class EvalPseudoSandbox:
         :Note:      the variable-name has to be quoted! (like in eval)
         :Example:   see module-docstring
         """
-        return (varname in self.locals_ptr)
+        return (varname in self._locals())
 
     def f_default(self, expr, default=None):
         """``default()`` for the sandboxed code.
@@ -928,7 +2207,7 @@ class EvalPseudoSandbox:
         :Example:   see module-docstring
         """
         try:
-            r = self.eval(expr, self.locals_ptr)
+            r = self.eval(expr, self._locals())
             if r is None:
                 return default
             return r
@@ -943,9 +2222,67 @@ class EvalPseudoSandbox:
 
         :Example:   see module-docstring
         """
-        self.locals_ptr[name] = self.eval(expr, self.locals_ptr)
+        locals = self._locals()
+        locals[name] = self.eval(expr, locals)
         return ""
 
+#-----------------------------------------
+# data-namespace
+
+class Scope(dict):
+    """Data-namespace (a "frame"), layered on a parent-namespace.
+
+    Contains the variables defined in this frame (i.e. the data passed
+    when rendering a template, or the parameters of a macro); all other
+    variables are looked up in the parent-namespace. So rendering a
+    template or calling a macro does not need to copy the whole namespace.
+
+    Setting a variable (incl. the loop-variables of a 'for'-block,
+    ``setvar()`` and macro-definitions) always sets it in this frame, so
+    it is still set after the 'for'-block, like in a copy of the
+    namespace; ``keys()``, ``len()`` etc. only refer to this frame, too.
+
+    :Example:
+
+        >>> t = Template(u'${setvar("n", "0")}{% for x in xs %}${setvar("n", "n+1")}{% end %}{{ n }} {{ x }}')
+        >>> t(xs=[1, 2, 3])
+        u'3 3'
+        >>> Template(u'{% for x in xs %}{% end %}{{ x }}', renderer_class=Renderer)(xs=[1, 2, 3])
+        u'3'
+
+    ``budget`` is the `_Budget` of the rendering if it has `RenderLimits`
+    (inherited from the parent-namespace), or None.
+    """
+    __slots__ = ['parent', 'budget']
+
+    def __init__(self, parent, *args, **kwargs):
+        """
+        :Parameters:
+            - `parent`: parent-namespace (dictionary or `Scope`)
+            - `args`, `kwargs`: variables of this frame (like ``dict()``)
+        """
+        dict.__init__(self, *args, **kwargs)
+        self.parent = parent
+        if isinstance(parent, Scope):
+            self.budget = parent.budget
+        else:
+            self.budget = None
+
+    def __missing__(self, key):
+        return self.parent[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.parent
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 #-----------------------------------------
 # basic template / subtemplate
 
@@ -956,7 +2293,7 @@ class TemplateBase:
     the template.
     """
 
-    def __init__(self, parsetree, renderfunc, data=None):
+    def __init__(self, parsetree, renderfunc, data=None, iterfunc=None):
         """Create the Template/Subtemplate/Macro.
 
         :Parameters:
@@ -964,6 +2301,8 @@ class TemplateBase:
             - `renderfunc`: render-function
             - `data`: data to fill into the template by default (dictionary).
               This data may later be overridden when rendering the template.
+            - `iterfunc`: render-function yielding the output piece by piece
+              (i.e. ``Renderer().iter_render``), used by `iter_render()`
         :Exceptions:
             - `TypeError`: if `data` is not a dictionary
         """
@@ -975,8 +2314,8 @@ class TemplateBase:
             self.data = {}
         else:
             raise TypeError('"data" must be a dict (or None).')
-        self.current_data = data
         self._render = renderfunc
+        self._iter_render = iterfunc
 
     def __call__(self, **override):
         """Fill out/render the template.
@@ -988,12 +2327,99 @@ class TemplateBase:
         :Note:       This is also called when invoking macros
                      (i.e. ``$!mymacro()!$``).
         """
-        self.current_data = self.data.copy()
-        self.current_data.update(override)
-        u = u"".join(self._render(self.parsetree, self.current_data))
-        self.current_data = self.data       # restore current_data
+        u = u"".join(self._render(self.parsetree, Scope(self.data, override)))
         return _dontescape(u)               # (see class _dontescape)
 
+    def iter_render(self, **override):
+        """Render the template piece by piece.
+
+        Like `__call__`, but the output is yielded while rendering, without
+        keeping all of it in memory. Joining the pieces gives the same
+        output as `__call__`.
+
+        :Parameters:
+            - `override`: objects to add to the data-namespace, overriding
+              the "default"-data.
+        :Returns:    an iterator over output-unicode-strings
+        """
+        data = Scope(self.data, override)
+        if self._iter_render is None:
+            return iter(self._render(self.parsetree, data))
+        return self._iter_render(self.parsetree, data)
+
+    def render_to(self, stream, **override):
+        """Render the template into a stream.
+
+        :Parameters:
+            - `stream`: file-like object, the output-unicode-strings are
+              written to (e.g. ``codecs.getwriter("utf-8")(f)``)
+            - `override`: objects to add to the data-namespace, overriding
+              the "default"-data.
+        """
+        write = stream.write
+        for chunk in self.iter_render(**override):
+            write(chunk)
+
+    def render_many(self, datasets, executor=None, chunksize=32):
+        """Render the template once for every data-set.
+
+        Like calling the template for every data-set, but the template is
+        only looked up once; the renderings may also be spread over the
+        workers of an executor.
+
+        :Parameters:
+            - `datasets`: iterable of dictionaries, each overriding the
+              "default"-data for one rendering (like the keyword-arguments
+              of `__call__`)
+            - `executor`: executor to render with (an object with
+              ``submit(func, *args)`` returning a future, e.g. a
+              ``concurrent.futures.ThreadPoolExecutor``), or None to
+              render in the calling thread.
+              The template is shared by the workers, so the executor must
+              run them in this process (i.e. not a ProcessPoolExecutor).
+            - `chunksize`: number of data-sets per executor-task
+        :Returns:    an iterator over the filled templates (in unicode),
+                     in the order of `datasets`
+        """
+        if executor is None:
+            return self._render_many(datasets)
+        return self._render_many_async(datasets, executor, chunksize)
+
+    def _render_many(self, datasets):
+        """Render the template for every data-set (see `render_many`)."""
+        render, parsetree, data = self._render, self.parsetree, self.data
+        for override in datasets:
+            yield _dontescape(u"".join(render(parsetree, Scope(data, override))))
+
+    def _render_chunk(self, datasets):
+        """Render a chunk of data-sets in a worker of `render_many`."""
+        return list(self._render_many(datasets))
+
+    # maximum number of chunks submitted to the executor, but not yet yielded
+    _render_many_pending = 16
+
+    def _render_many_async(self, datasets, executor, chunksize):
+        """Render the data-sets in chunks by an executor (see `render_many`)."""
+        if chunksize < 1:
+            raise ValueError('"chunksize" must be at least 1.')
+        pending = collections.deque()
+        datasets = iter(datasets)
+        try:
+            while True:
+                # keep the executor busy, without reading all data-sets at once
+                while len(pending) < self._render_many_pending:
+                    chunk = list(itertools.islice(datasets, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(self._render_chunk, chunk))
+                if not pending:
+                    break
+                for result in pending.popleft().result():
+                    yield result
+        finally:                        # i.e. on errors or if not consumed
+            for future in pending:
+                future.cancel()
+
     def __unicode__(self):
         """Alias for __call__()."""
         return self.__call__()
@@ -1016,14 +2442,72 @@ class _dontescape(unicode):
     """
     __slots__ = []
 
+class _MacroDefinition(object):
+    """A macro-block of a template, created once per renderer.
+
+    ``render(data)`` renders the body of the macro (see `Renderer.render`),
+    ``iter_render(parsetree, data)`` renders it piece by piece.
+    """
+    __slots__ = ["parsetree", "render", "iter_render"]
+
+    def __init__(self, parsetree, render, iter_render):
+        self.parsetree   = parsetree
+        self.render      = render
+        self.iter_render = iter_render
+
+class _Macro(object):
+    """A macro, bound to the data-namespace it was defined in.
+
+    Calling the macro renders it with its own data-namespace for the
+    arguments, like calling a `TemplateBase`.
+    """
+    __slots__ = ["_definition", "_data"]
+
+    def __init__(self, definition, data):
+        self._definition = definition
+        self._data       = data
+
+    def _scope(self, override):
+        """Create the data-namespace of a call of the macro."""
+        data = Scope(self._data, override)
+        if data.budget is not None:
+            # a call counts as loop-iteration (i.e. for recursive macros)
+            data.budget.iteration()
+            data.budget = data.budget.macro()
+        return data
+
+    def __call__(self, **override):
+        """Render the macro. (see `TemplateBase.__call__`)"""
+        return _dontescape(u"".join(self._definition.render(self._scope(override))))
+
+    def iter_render(self, **override):
+        """Render the macro piece by piece. (see `TemplateBase.iter_render`)"""
+        definition = self._definition
+        return definition.iter_render(definition.parsetree, self._scope(override))
+
+    def __unicode__(self):
+        """Alias for __call__()."""
+        return self.__call__()
+    def __str__(self):
+        """Only here for completeness. Use __unicode__ instead!"""
+        return self.__call__()
+
+def _raise_eval_error(expr, err):
+    """Raise a `TemplateRenderError` for a failed template-expression."""
+    raise TemplateRenderError("Cannot eval expression '%s'. (%s: %s)" %(expr, err.__class__.__name__, err))
+
+def _raise_loop_error(expr):
+    """Raise a `TemplateRenderError` for a non-iterable 'for'-expression."""
+    raise TemplateRenderError("Cannot loop over '%s'." % expr)
+
 
 class Renderer(object):
     """Render a template-parse-tree.
     
-    :Uses: `TemplateBase` for macros
+    :Uses: `_Macro` for macros
     """
 
-    def __init__(self, evalfunc, escapefunc):
+    def __init__(self, evalfunc, escapefunc, limits=None):
         """Init the renderer.
 
         :Parameters:
@@ -1031,18 +2515,33 @@ class Renderer(object):
               (i.e. ``EvalPseudoSandbox().eval``)
             - `escapefunc`: function for escaping special characters
               (i.e. `escape`)
+            - `limits`: `RenderLimits` for every rendering, or None
         """
         #TODO: test evalfunc
         self.evalfunc = evalfunc
         self.escapefunc = escapefunc
+        self.limits = limits
+        self._macros = {}       # id(parsetree) -> (parsetree, _MacroDefinition)
+
+    # errors of evalfunc, which are converted to TemplateRenderError
+    #TODO: any other errors to catch here?
+    _eval_errors = (TypeError,NameError,IndexError,KeyError,AttributeError, SyntaxError)
 
     def _eval(self, expr, data):
         """evalfunc with error-messages"""
         try:
             return self.evalfunc(expr, data)
-        #TODO: any other errors to catch here?
-        except (TypeError,NameError,IndexError,KeyError,AttributeError, SyntaxError), err:
-            raise TemplateRenderError("Cannot eval expression '%s'. (%s: %s)" %(expr, err.__class__.__name__, err))
+        except self._eval_errors, err:
+            _raise_eval_error(expr, err)
+
+    def _macro(self, parsetree):
+        """Get the `_MacroDefinition` of the macro-body `parsetree`."""
+        try:
+            return self._macros[id(parsetree)][1]
+        except KeyError:
+            definition = _MacroDefinition(parsetree, functools.partial(self.render, parsetree), self.iter_render)
+            self._macros[id(parsetree)] = (parsetree, definition)
+            return definition
 
     def render(self, parsetree, data):
         """Render a parse-tree of a template.
@@ -1057,6 +2556,9 @@ class Renderer(object):
         _eval = self._eval  # shortcut
         output = []
         do_else = False     # use else/elif-branch?
+        budget = None
+        if self.limits is not None:
+            budget = _budget(self.limits, data)
 
         if parsetree is None:
             return ""
@@ -1068,7 +2570,7 @@ class Renderer(object):
             elif "esc"   == elem[0]:
                 obj = _eval(elem[2], data)
                 #prevent double-escape
-                if isinstance(obj, _dontescape) or isinstance(obj, TemplateBase):
+                if isinstance(obj, (_dontescape, TemplateBase, _Macro)):
                     output.append(unicode(obj))
                 else:
                     output.append(self.escapefunc(unicode(obj), elem[1]))
@@ -1078,9 +2580,11 @@ class Renderer(object):
                 try:
                     loop_iter = iter(_eval(iterable, data))
                 except TypeError:
-                    raise TemplateRenderError("Cannot loop over '%s'." % iterable)
+                    _raise_loop_error(iterable)
                 for i in loop_iter:
                     do_else = False
+                    if budget is not None:
+                        budget.iteration()
                     if len(names) == 1:
                         data[names[0]] = i
                     else:
@@ -1100,12 +2604,514 @@ class Renderer(object):
                     do_else = False
                     output.extend(self.render(elem[1], data))
             elif "macro" == elem[0]:
-                data[elem[1]] = TemplateBase(elem[2], self.render, data)
+                data[elem[1]] = _Macro(self._macro(elem[2]), data)
             else:
                 raise TemplateRenderError("Invalid parse-tree (%s)." %(elem))
+            if budget is not None  and  elem[0] in ("str", "sub", "esc"):
+                budget.out(output[-1])
 
         return output
 
+    def iter_render(self, parsetree, data):
+        """Render a parse-tree of a template piece by piece.
+
+        Like `render`, but yields the output-unicode-strings while
+        rendering instead of collecting them.
+        """
+        _eval = self._eval  # shortcut
+        do_else = False     # use else/elif-branch?
+        budget = None
+        if self.limits is not None:
+            budget = _budget(self.limits, data)
+
+        if parsetree is None:
+            return
+        for elem in parsetree:
+            if elem[0] in ("str", "sub", "esc"):
+                if   "str"   == elem[0]:
+                    chunk = elem[1]
+                elif "sub"   == elem[0]:
+                    chunk = unicode(_eval(elem[1], data))
+                else:
+                    obj = _eval(elem[2], data)
+                    #prevent double-escape
+                    if isinstance(obj, (_dontescape, TemplateBase, _Macro)):
+                        chunk = unicode(obj)
+                    else:
+                        chunk = self.escapefunc(unicode(obj), elem[1])
+                if budget is not None:
+                    budget.out(chunk)
+                yield chunk
+            elif "for"   == elem[0]:
+                do_else = True
+                (names, iterable) = elem[1:3]
+                try:
+                    loop_iter = iter(_eval(iterable, data))
+                except TypeError:
+                    _raise_loop_error(iterable)
+                for i in loop_iter:
+                    do_else = False
+                    if budget is not None:
+                        budget.iteration()
+                    if len(names) == 1:
+                        data[names[0]] = i
+                    else:
+                        data.update(zip(names, i))   #"for a,b,.. in list"
+                    for chunk in self.iter_render(elem[3], data):
+                        yield chunk
+            elif "if"    == elem[0]:
+                do_else = True
+                if _eval(elem[1], data):
+                    do_else = False
+                    for chunk in self.iter_render(elem[2], data):
+                        yield chunk
+            elif "elif"  == elem[0]:
+                if do_else and _eval(elem[1], data):
+                    do_else = False
+                    for chunk in self.iter_render(elem[2], data):
+                        yield chunk
+            elif "else"  == elem[0]:
+                if do_else:
+                    do_else = False
+                    for chunk in self.iter_render(elem[1], data):
+                        yield chunk
+            elif "macro" == elem[0]:
+                data[elem[1]] = _Macro(self._macro(elem[2]), data)
+            else:
+                raise TemplateRenderError("Invalid parse-tree (%s)." %(elem))
+
+class _NotCompilable(Exception):
+    """A parse-tree cannot be compiled by `CompiledRenderer`."""
+    pass
+
+class CompiledRenderer(Renderer):
+    """Render a template-parse-tree by compiling it to a Python-function.
+
+    Every parse-tree is translated once into a single Python-function,
+    which evaluates the expressions and appends the output directly,
+    instead of walking the parse-tree again on every rendering.
+    Macros are compiled into functions of their own, together with the
+    parse-tree containing them.
+
+    If `evalfunc` is ``EvalPseudoSandbox().eval``, the expressions are
+    compiled by the sandbox and their code-objects are evaluated inline;
+    otherwise `evalfunc` is called for every expression.
+
+    For `iter_render`, the parse-tree is compiled into a generator-function
+    instead.
+
+    Compiling costs more than rendering a parse-tree once, so a parse-tree
+    is first rendered `compile_threshold` times by a `Renderer`, and only
+    compiled if it is rendered again. If a parse-tree cannot be compiled
+    (e.g. if its blocks are nested too deeply for Python), it is always
+    rendered by `Renderer`.
+
+    A CompiledRenderer may be used by several threads at the same time.
+
+    The checks of `limits` are only generated if there are limits, so
+    they cost nothing otherwise.
+
+    :Uses: `_Macro` for macros
+    """
+
+    # number of renderings of a parse-tree before it is compiled
+    compile_threshold = 1
+
+    def __init__(self, evalfunc, escapefunc, limits=None):
+        """Init the renderer. (see `Renderer.__init__`)"""
+        Renderer.__init__(self, evalfunc, escapefunc, limits)
+        self._compiled = {}     # id(parsetree) -> (parsetree, renderfunction)
+        self._compiled_iter = {}  # id(parsetree) -> (parsetree, generatorfunction)
+        self._rendered = {}     # id(parsetree) -> (parsetree, count)
+        self._walker   = Renderer(evalfunc, escapefunc, limits)
+        self._lock     = threading.RLock()    # for compiling
+        if getattr(evalfunc, "im_func", None) is EvalPseudoSandbox.eval.im_func:
+            self._sandbox = evalfunc.im_self
+        else:
+            self._sandbox = None
+
+    def render(self, parsetree, data):
+        """Render a parse-tree of a template. (see `Renderer.render`)
+
+        The parse-tree is compiled when it is rendered more than
+        `compile_threshold` times.
+        """
+        try:
+            func = self._compiled[id(parsetree)][1]
+        except KeyError:
+            if self._count(parsetree):
+                return self._walker.render(parsetree, data)
+            func = self.compile(parsetree)
+        return func(data)
+
+    def iter_render(self, parsetree, data):
+        """Render a parse-tree of a template piece by piece. (see `Renderer.iter_render`)"""
+        try:
+            func = self._compiled_iter[id(parsetree)][1]
+        except KeyError:
+            if self._count(parsetree):
+                return self._walker.iter_render(parsetree, data)
+            func = self.compile(parsetree, streaming=True)
+        return func(data)
+
+    def _count(self, parsetree):
+        """Count a rendering of a parse-tree, which is not compiled yet.
+
+        :Returns: True if the parse-tree should not be compiled yet
+        """
+        count = self._rendered.get(id(parsetree), (None, 0))[1]
+        if count < self.compile_threshold:
+            self._rendered[id(parsetree)] = (parsetree, count+1)
+            return True
+        return False
+
+    def compile(self, parsetree, streaming=False):
+        """Compile a parse-tree to a render-function.
+
+        :Parameters:
+            - `parsetree`: the parse-tree
+            - `streaming`: compile a generator-function (for `iter_render`)
+        :Returns: a function ``f(data)``, which returns the rendered
+                  output-unicode-strings (in a list, or as a generator)
+        """
+        if streaming:
+            compiled, fallback = self._compiled_iter, Renderer.iter_render
+        else:
+            compiled, fallback = self._compiled, Renderer.render
+        with self._lock:
+            if id(parsetree) in compiled:   # compiled by another thread meanwhile
+                return compiled[id(parsetree)][1]
+            if parsetree is None:
+                func = lambda data: fallback(self, parsetree, data)
+            else:
+                try:
+                    func = self._compile(parsetree, streaming)
+                except (_NotCompilable, SyntaxError, RuntimeError, MemoryError):
+                    func = lambda data: fallback(self, parsetree, data)
+            compiled[id(parsetree)] = (parsetree, func)
+        return func
+
+    # header of the generated functions
+    _header = ["def %s(data, _eval=eval, _escape=_escape, _evalerrors=_evalerrors,",
+               "            _unicode=unicode, _isinstance=isinstance, _noescape=_noescape):"]
+
+    def _compile(self, parsetree, streaming):
+        """Generate the Python-source of `parsetree` and compile it."""
+        self._namespace = namespace = {
+            "_evalfunc":    self.evalfunc,
+            "_evalpath":    self._eval,
+            "_evalerror":   _raise_eval_error,
+            "_looperror":   _raise_loop_error,
+            "_Macro":       _Macro,
+            "_zip":         zip,
+            "_iter":        iter,
+            "_escape":      self.escapefunc,
+            "_evalerrors":  self._eval_errors,
+            "_noescape":    (_dontescape, TemplateBase, _Macro),
+            "_budget":      _budget,
+            "_limits":      self.limits,
+        }
+        self._counter = 0
+        self._macro_bodies = [] # [(name, parsetree)] of the macro-functions
+        self._functions = []    # Python-source of the macro-functions
+        self._limited = self.limits is not None
+        lines = self._gen_header("_render")
+        if streaming:
+            self._emit = self._limited and "yield _b.out(%s)" or "yield %s"
+        else:
+            self._emit = self._limited and "_append(_b.out(%s))" or "_append(%s)"
+            lines.append("    _out = []")
+            lines.append("    _append = _out.append")
+        self._inline = self._sandbox is not None
+        if self._inline:
+            namespace["_globals"] = self._sandbox._globals
+        self._gen(parsetree, lines, "    ", "data")
+        if streaming:
+            lines.append("    return")
+            lines.append("    yield None    # a generator, even if nothing is yielded")
+        else:
+            lines.append("    return _out")
+        lines.extend(self._functions)
+        macros = self._macro_bodies
+        del self._namespace, self._macro_bodies, self._functions
+        exec compile("\n".join(lines), "<pyratemp>", "exec") in namespace
+        for (name, subtree) in macros:
+            namespace["_md" + name] = _MacroDefinition(subtree, namespace["_m" + name], self.iter_render)
+        return namespace["_render"]
+
+    def _gen_header(self, name):
+        """Generate the header of the function `name`.
+
+        :Returns: the lines of the header
+        """
+        lines = [self._header[0] % name] + self._header[1:]
+        if self._limited:
+            lines.append("    _b = _budget(_limits, data)")
+        return lines
+
+    def _gen_macro(self, parsetree):
+        """Generate a function for the macro-body `parsetree`.
+
+        :Returns: the number of the macro, the function is ``_m<number>``
+                  and its `_MacroDefinition` ``_md<number>``
+        """
+        self._counter += 1
+        name = str(self._counter)
+        lines = self._gen_header("_m" + name)
+        lines.append("    _out = []")
+        lines.append("    _append = _out.append")
+        # (macros are never streamed)
+        emit, self._emit = self._emit, self._limited and "_append(_b.out(%s))" or "_append(%s)"
+        self._gen(parsetree, lines, "    ", "data")
+        self._emit = emit
+        lines.append("    return _out")
+        self._functions.extend(lines)
+        self._macro_bodies.append((name, parsetree))
+        return name
+
+    def _gen_eval(self, expr, lines, ind, data):
+        """Generate the evaluation of `expr` into the local variable ``_v``."""
+        code = path = None
+        if self._inline:
+            try:
+                code = self._sandbox.compile(expr)
+                path = self._sandbox.path(expr)
+            except Exception:   # let the evalfunc raise the error when rendering
+                pass
+        lines.append("%stry:"                           % (ind))
+        if code is None:
+            lines.append("%s    _v = _evalfunc(%r, %s)" % (ind, expr, data))
+        elif path is not None:
+            # simple expression (see EvalPseudoSandbox.path): get it
+            # directly; if the name is not in data or anything fails, get
+            # it again by evalfunc (i.e. for the error-message)
+            names = expr.strip().split(".")
+            lines.append("%s    _v = %s[%r]%s" % (ind, data, names[0], "".join(["." + n for n in names[1:]])))
+            lines.append("%sexcept _evalerrors:"        % (ind))
+            lines.append("%s    _v = _evalpath(%r, %s)" % (ind, expr, data))
+            return
+        else:
+            self._counter += 1
+            self._namespace["_c%d" % self._counter] = code
+            lines.append("%s    _v = _eval(_c%d, _globals, %s)" % (ind, self._counter, data))
+        lines.append("%sexcept _evalerrors, _err:"      % (ind))
+        lines.append("%s    _evalerror(%r, _err)"       % (ind, expr))
+
+    def _gen(self, parsetree, lines, ind, data):
+        """Generate the Python-source for the elements of `parsetree`.
+
+        Behaves exactly like `Renderer.render`, incl. the handling of
+        'else'/'elif' (``do_else``), which is only generated if needed.
+        """
+        start = len(lines)
+        self._counter += 1
+        if [elem for elem in parsetree if elem[0] in ("elif", "else")]:
+            do_else = "_e%d" % self._counter
+            lines.append("%s%s = False" % (ind, do_else))
+        else:
+            do_else = None
+
+        for elem in parsetree:
+            if   "str"   == elem[0]:
+                lines.append(ind + self._emit % repr(elem[1]))
+            elif "sub"   == elem[0]:
+                self._gen_eval(elem[1], lines, ind, data)
+                lines.append(ind + self._emit % "_unicode(_v)")
+            elif "esc"   == elem[0]:
+                self._gen_eval(elem[2], lines, ind, data)
+                lines.append("%sif _isinstance(_v, _noescape):" % (ind))
+                lines.append(ind + "    " + self._emit % "_unicode(_v)")
+                lines.append("%selse:" % (ind))
+                lines.append(ind + "    " + self._emit % ("_escape(_unicode(_v), %r)" % elem[1]))
+            elif "for"   == elem[0]:
+                (names, iterable) = elem[1:3]
+                loop_iter = "_i%d" % self._counter
+                self._gen_eval(iterable, lines, ind, data)
+                lines.append("%stry:"                   % (ind))
+                lines.append("%s    %s = _iter(_v)"     % (ind, loop_iter))
+                lines.append("%sexcept TypeError:"      % (ind))
+                lines.append("%s    _looperror(%r)"     % (ind, iterable))
+                if do_else:
+                    lines.append("%s%s = True" % (ind, do_else))
+                if len(names) == 1:
+                    lines.append("%sfor %s[%r] in %s:" % (ind, data, names[0], loop_iter))
+                else:                                   #"for a,b,.. in list"
+                    lines.append("%sfor _v in %s:" % (ind, loop_iter))
+                    lines.append("%s    %s.update(_zip(%r, _v))" % (ind, data, tuple(names)))
+                if self._limited:
+                    lines.append("%s    _b.iteration()" % (ind))
+                if do_else:
+                    lines.append("%s    %s = False" % (ind, do_else))
+                self._gen(elem[3], lines, ind+"    ", data)
+            elif "if"    == elem[0]:
+                if do_else:
+                    lines.append("%s%s = True" % (ind, do_else))
+                self._gen_eval(elem[1], lines, ind, data)
+                lines.append("%sif _v:" % (ind))
+                if do_else:
+                    lines.append("%s    %s = False" % (ind, do_else))
+                self._gen(elem[2], lines, ind+"    ", data)
+            elif "elif"  == elem[0]:
+                lines.append("%sif %s:" % (ind, do_else))
+                self._gen_eval(elem[1], lines, ind+"    ", data)
+                lines.append("%s    if _v:" % (ind))
+                lines.append("%s        %s = False" % (ind, do_else))
+                self._gen(elem[2], lines, ind+"        ", data)
+            elif "else"  == elem[0]:
+                lines.append("%sif %s:" % (ind, do_else))
+                lines.append("%s    %s = False" % (ind, do_else))
+                self._gen(elem[1], lines, ind+"    ", data)
+            elif "macro" == elem[0]:
+                name = self._gen_macro(elem[2])
+                lines.append("%s%s[%r] = _Macro(_md%s, %s)" % (ind, data, elem[1], name, data))
+            else:
+                raise _NotCompilable(elem)
+
+        if len(lines) == start:
+            lines.append("%spass" % (ind))
+
+#-----------------------------------------
+# Profiling
+
+class RenderProfile(object):
+    """Call-counts and times of the parse-tree-nodes rendered by a
+    `ProfilingRenderer`.
+
+    For every node (except strings), it counts how often it was rendered,
+    the cumulative time (incl. the nested nodes, i.e. the body of a loop or
+    the macros called) and the cumulative time of evaluating its
+    expression. The time of recursive macros is counted more than once.
+    """
+
+    def __init__(self, positions=None):
+        """
+        :Parameters:
+            - `positions`: source-positions of the nodes (see `Parser`)
+        """
+        if positions is None:
+            positions = {}
+        self.positions = positions
+        self._stats = {}        # id(node) -> [node, calls, time, eval_time]
+
+    def stats(self, node):
+        """Get the (mutable) statistics of a node."""
+        try:
+            return self._stats[id(node)]
+        except KeyError:
+            return self._stats.setdefault(id(node), [node, 0, 0.0, 0.0])
+
+    def reset(self):
+        """Forget all statistics."""
+        self._stats.clear()
+
+    @staticmethod
+    def _describe(node):
+        """Get the expression (or the macro-name) of a node."""
+        if node[0] == "for":
+            return "%s in %s" % (", ".join(node[1]), node[2])
+        elif node[0] in ("sub", "if", "elif", "macro"):
+            return node[1]
+        elif node[0] == "esc":
+            return node[2]
+        return ""
+
+    def rows(self):
+        """Get the statistics, the slowest nodes first.
+
+        :Returns: list of dictionaries with ``filename``, ``row``, ``col``
+                  (None if unknown), ``node`` (i.e. "for"), ``expr``,
+                  ``calls``, ``time`` and ``eval_time`` (in seconds)
+        """
+        rows = []
+        for (node, calls, time, eval_time) in self._stats.values():
+            (filename, row, col) = self.positions.get(id(node), (None, (None, None, None)))[1]
+            rows.append({"filename": filename, "row": row, "col": col,
+                         "node": node[0], "expr": self._describe(node),
+                         "calls": calls, "time": time, "eval_time": eval_time})
+        rows.sort(key=lambda r: (-r["time"], r["row"], r["col"]))
+        return rows
+
+    def table(self, limit=None):
+        """Get the statistics as a table.
+
+        :Parameters:
+            - `limit`: max. number of nodes (the slowest ones), or None
+        :Returns: the table (unicode)
+        """
+        lines = [u"%-16s %5s %4s %-6s %8s %11s %11s  %s" % ("file", "line", "col", "node", "calls", "time [ms]", "eval [ms]", "expression")]
+        for r in self.rows()[:limit]:
+            lines.append(u"%-16s %5s %4s %-6s %8d %11.3f %11.3f  %s" % (r["filename"] or "-",
+                    r["row"] or "-", r["col"] or "-", r["node"], r["calls"],
+                    r["time"] * 1000, r["eval_time"] * 1000, r["expr"]))
+        return u"\n".join(lines)
+
+    def json(self, **kwargs):
+        """Get the statistics (see `rows`) as JSON.
+
+        :Parameters:
+            - `kwargs`: parameters for ``json.dumps`` (i.e. ``indent``)
+        """
+        import json
+        return json.dumps(self.rows(), **kwargs)
+
+class ProfilingRenderer(Renderer):
+    """Render a template-parse-tree, and profile every node.
+
+    Like `Renderer`, but records call-counts and times for every node and
+    its expression in ``profile`` (a `RenderProfile`). It is slower than
+    `Renderer`, so only use it to find slow parts of a template (see
+    ``Template(..., profile=True)``); the other renderers are not affected
+    by profiling.
+
+    It renders with `Renderer.render`, passing it the nodes one by one
+    (see `_timed`), so `Renderer` itself has no profiling-code.
+    `iter_render` renders the complete output before yielding it.
+    """
+
+    def __init__(self, evalfunc, escapefunc, positions=None, limits=None):
+        """Init the renderer. (see `Renderer.__init__`)
+
+        :Parameters:
+            - `positions`: source-positions of the nodes (see `Parser`)
+        """
+        Renderer.__init__(self, evalfunc, escapefunc, limits)
+        self.profile = RenderProfile(positions)
+        self._stats = None      # statistics of the node being rendered
+
+    def _timed(self, parsetree):
+        """Yield the nodes of `parsetree`, and count and time every node
+        (except "str") until the next one is requested.
+        """
+        for elem in parsetree:
+            if "str" == elem[0]:
+                yield elem
+                continue
+            stats = self.profile.stats(elem)
+            self._stats = stats     # node whose expression is evaluated
+            t0 = _timer()
+            yield elem
+            stats[1] += 1
+            stats[2] += _timer() - t0
+
+    def _eval(self, expr, data):
+        """`Renderer._eval`, adding the time to the statistics of the node."""
+        stats = self._stats
+        t0 = _timer()
+        try:
+            return Renderer._eval(self, expr, data)
+        finally:
+            stats[3] += _timer() - t0
+
+    def render(self, parsetree, data):
+        """Render a parse-tree of a template. (see `Renderer.render`)"""
+        if parsetree is None:
+            return ""
+        return Renderer.render(self, self._timed(parsetree), data)
+
+    def iter_render(self, parsetree, data):
+        """Render a parse-tree of a template. (see `Renderer.iter_render`)"""
+        return iter(self.render(parsetree, data))
+
 #-----------------------------------------
 # template user-interface (putting all together)
 
@@ -1124,9 +3130,14 @@ class Template(TemplateBase):
     def __init__(self, string=None,filename=None,parsetree=None, encoding='utf-8', data=None, escape=HTML,
             loader_class=LoaderFile,
             parser_class=Parser,
-            renderer_class=Renderer,
+            renderer_class=CompiledRenderer,
             eval_class=EvalPseudoSandbox,
-            escape_func=escape):
+            escape_func=escape,
+            cache=None,
+            optimizer_class=Optimizer,
+            includes=None,
+            profile=False,
+            limits=None):
         """Load (+parse) a template.
 
         :Parameters:
@@ -1143,6 +3154,20 @@ class Template(TemplateBase):
             - `renderer_class`
             - `eval_class`
             - `escapefunc`
+            - `cache`:    `ParseTreeCache` for the parse-tree (only used for "filename")
+            - `optimizer_class`: `Optimizer` for the parse-tree, or None.
+                          The number of removed nodes is in ``removed_nodes``.
+            - `includes`: dictionary to cache the parse-trees of included
+                          templates in, shared with other templates of the
+                          same directory (see `TemplateRegistry`).
+                          The filenames of all included templates are in
+                          ``dependencies``.
+            - `profile`:  render with a `ProfilingRenderer` (instead of
+                          `renderer_class`), without `cache`, `includes` and
+                          optimizer; the `RenderProfile` is in ``profile``
+            - `limits`:   `RenderLimits` for rendering (i.e. for templates
+                          entered by users), passed to `eval_class` and
+                          `renderer_class`
         """
         if [string, filename, parsetree].count(None) != 2:
             raise ValueError('Exactly 1 of string,filename,parsetree is necessary.')
@@ -1157,19 +3182,70 @@ class Template(TemplateBase):
             tmpl = LoaderString(encoding).load(string)
 
         # eval (incl. compile-cache)
-        templateeval = eval_class()
+        if limits is not None:
+            templateeval = eval_class(limits=limits)
+        else:
+            templateeval = eval_class()
+
+        self.dependencies = frozenset()
+
+        # profiling needs the positions of all nodes, and the unoptimized parse-tree
+        positions = None
+        if profile:
+            positions = {}
+            cache = includes = optimizer_class = None
+
+        # load the parse-tree from the cache
+        if cache is not None and filename is not None:
+            key = cache.key(tmpl, escape, encoding, parser_class.__name__)
+            cached = cache.load(key, incl_load)
+            if cached is not None:
+                (parsetree, codes, dependencies) = cached
+                templateeval.add_compiled(codes)
+                self.dependencies = frozenset(dependencies)
+                tmpl = None
 
         # parse
         if tmpl is not None:
-            p = parser_class(loadfunc=incl_load, testexpr=templateeval.compile, escape=escape)
+            loaded = []
+            def load_and_record(filename):
+                u = incl_load(filename)
+                loaded.append((filename, u))
+                return u
+            kwargs = {}
+            if includes is not None:
+                kwargs["includes"] = includes
+            if positions is not None:
+                kwargs["positions"] = positions
+            p = parser_class(loadfunc=load_and_record, testexpr=templateeval.compile, escape=escape, **kwargs)
             parsetree = p.parse(tmpl)
+            self.dependencies = frozenset(p.dependencies)
             del p
+            if cache is not None and filename is not None:
+                # (includes taken from `includes` were not loaded again)
+                loaded.extend([(name, incl_load(name)) for name in self.dependencies - set(dict(loaded))])
+                cache.store(key, parsetree, loaded, templateeval.compiled())
+
+        # optimize
+        self.removed_nodes = 0
+        if optimizer_class is not None:
+            optimizer = optimizer_class(escape_func)
+            parsetree = optimizer.optimize(parsetree)
+            self.removed_nodes = optimizer.removed
 
         # renderer
-        renderfunc = renderer_class(templateeval.eval, escape_func).render
+        if profile:
+            renderer = ProfilingRenderer(templateeval.eval, escape_func, positions, limits)
+            self.profile = renderer.profile
+        elif limits is not None:
+            renderer = renderer_class(templateeval.eval, escape_func, limits=limits)
+            self.profile = None
+        else:
+            renderer = renderer_class(templateeval.eval, escape_func)
+            self.profile = None
 
         #create template
-        TemplateBase.__init__(self, parsetree, renderfunc, data)
+        TemplateBase.__init__(self, parsetree, renderer.render, data, getattr(renderer, "iter_render", None))
 
 
 #=========================================
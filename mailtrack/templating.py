@@ -0,0 +1,76 @@
+import  collections, threading
+import  pyratemp
+
+# A template string, rendered by the cheapest engine which produces the
+# same output as pyratemp:
+#
+#   text        no placeholders or blocks at all: the text itself
+#   pyratemp    everything else (compiled by pyratemp.CompiledRenderer,
+#               which gets simple names and attributes directly)
+#
+# The engine is chosen once; render is the function rendering with it
+# (for pyratemp, the pyratemp.Template itself), so a rendering does not
+# dispatch on the engine.
+class SelectedTemplate(object):
+
+    def __init__(self, string, **kwargs):
+        # the template is parsed by pyratemp in any case, to inspect it
+        self.template   = pyratemp.Template(string, **kwargs)
+        self.engine     = 'pyratemp'
+        self.render     = self.template
+
+        # not for profiling, and only if limits cannot be exceeded
+        limits = kwargs.get('limits')
+        if kwargs.get('profile') or (limits is not None and limits.max_output is not None):
+            return
+
+        parsetree = self.template.parsetree
+        if all([ elem[0] == 'str' for elem in parsetree ]):
+            self.engine = 'text'
+            self.text   = pyratemp._dontescape(u''.join([ elem[1] for elem in parsetree ]))
+            self.render = self._text
+
+    def _text(self, **data):
+        return self.text
+
+    def __call__(self, **data):
+        return self.render(**data)
+
+# Selects and caches the engine of template strings (i.e. attributions,
+# which are rendered again and again with the same string). Thread-safe;
+# the oldest templates are dropped if there are more than maxsize.
+# Keyword arguments are passed to pyratemp.Template.
+class TemplateSelector(object):
+
+    def __init__(self, maxsize = 100, **kwargs):
+        self.maxsize    = maxsize
+        self.kwargs     = kwargs
+        self._cache     = collections.OrderedDict()
+        self._lock      = threading.Lock()
+
+    def get(self, string):
+        # (looking up a dict is atomic, so hits need no lock)
+        template = self._cache.get(string)
+        if template is not None:
+            return template
+        # parse outside of the lock (a template parsed twice does no harm)
+        template = SelectedTemplate(string, **self.kwargs)
+        with self._lock:
+            self._cache[string] = template
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last = False)
+        return template
+
+    # name of the engine used for a template string
+    def engine(self, string):
+        return self.get(string).engine
+
+    def render(self, string, **data):
+        template = self._cache.get(string)
+        if template is None:
+            template = self.get(string)
+        return template.render(**data)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -1,4 +1,9 @@
-import  objc, re, htmlentitydefs
+import  objc, re, bisect
+from    Foundation  import NSLog
+from    timeit      import default_timer as timer
+
+# unescape HTML-escaped strings (see entities)
+from    entities    import htmlunescape, iter_htmlunescape
 
 # Method Swizzler: exchange an existing Objective-C method with a new
 # implementation (akin to monkeypatching)
@@ -9,54 +14,166 @@ def swizzle(cls, SEL):
         oldIMP = cls.instanceMethodForSelector_(SEL)
         if oldIMP.isClassMethod:
             oldIMP = cls.methodForSelector_(SEL)
-        def wrapper(self, *args, **kwargs):
-            return func(self, oldIMP, *args, **kwargs)
+        wrapper = _wrapper_factory(SEL.count(':'))(func, oldIMP, SEL, swizzle_stats)
         newMethod = objc.selector(wrapper, selector = oldIMP.selector, signature = oldIMP.signature, isClassMethod = oldIMP.isClassMethod)
         objc.classAddMethod(cls, SEL, newMethod)
         return wrapper
     return decorator
 
+# The wrappers calling the new implementations are generated for the
+# number of arguments of their selector, so calls (i.e. of sendEvent:,
+# for every event Mail receives) don't pack and unpack the arguments.
+_WRAPPER = """
+def factory(func, oldIMP, SEL, stats):
+    def wrapper(self%(args)s):
+        if stats.enabled:
+            return stats.call(SEL, func, self, oldIMP%(args)s)
+        return func(self, oldIMP%(args)s)
+    return wrapper
+"""
+_wrapper_factories = {}
+
+def _wrapper_factory(nargs):
+    factory = _wrapper_factories.get(nargs)
+    if factory is None:
+        namespace = {}
+        exec _WRAPPER % dict(args = ''.join([ ', arg%d' % i for i in range(nargs) ])) in namespace
+        factory = _wrapper_factories[nargs] = namespace['factory']
+    return factory
+
+# Call counts and latencies of the swizzled methods, per selector. Disabled
+# by default; when enabled (at runtime, with swizzle_stats.enable()), every
+# call is timed, as well as the time spent in the original method, so the
+# time added by the plugin is known; swizzle_stats.report() logs them. Not
+# thread-safe (swizzled methods are called on the main thread).
+class SwizzleStats:
+
+    # histogram buckets of the added time: up to 1us, 2us, 4us, ... ~1s
+    BUCKETS = [ 2 ** i * 1e-6 for i in range(21) ]
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.selectors = {}
+
+    def call(self, SEL, func, obj, oldIMP, *args):
+        original = _TimedIMP(oldIMP)
+        start    = timer()
+        try:
+            return func(obj, original, *args)
+        finally:
+            total = timer() - start
+            stats = self.selectors.get(SEL)
+            if stats is None:
+                stats = self.selectors[SEL] = _SelectorStats(len(self.BUCKETS) + 1)
+            stats.add(total, original.elapsed, bisect.bisect_left(self.BUCKETS, total - original.elapsed))
+
+    # time added by the plugin below which a fraction of the calls are
+    # (the upper bound of the histogram bucket)
+    def percentile(self, SEL, fraction):
+        stats = self.selectors[SEL]
+        count = 0
+        for bucket, n in enumerate(stats.histogram):
+            count += n
+            if count >= fraction * stats.calls:
+                break
+        return bucket < len(self.BUCKETS) and self.BUCKETS[bucket] or float('inf')
+
+    # log the statistics per selector (i.e. to Console.app), and return them
+    def report(self):
+        lines = [ '%-40s %10s %14s %14s %14s %14s' % ('selector', 'calls', 'added/call', 'added p50', 'added p99', 'original/call') ]
+        for SEL, stats in sorted(self.selectors.items()):
+            added = (stats.time - stats.original) / stats.calls
+            lines.append('%-40s %10d %12.1fus %12.0fus %12.0fus %12.1fus' % (SEL, stats.calls, added * 1e6,
+                self.percentile(SEL, 0.5) * 1e6, self.percentile(SEL, 0.99) * 1e6, stats.original / stats.calls * 1e6))
+        report = '\n'.join(lines)
+        NSLog(u'MailTrack: swizzle statistics\n%@', report)
+        return report
+
+class _SelectorStats:
+
+    def __init__(self, buckets):
+        self.calls      = 0
+        self.time       = 0.0   # total time of the calls
+        self.original   = 0.0   # time spent in the original method
+        self.histogram  = [ 0 ] * buckets
+
+    def add(self, time, original, bucket):
+        self.calls      += 1
+        self.time       += time
+        self.original   += original
+        self.histogram[bucket] += 1
+
+# the original method, timed (passed instead of oldIMP while instrumented)
+class _TimedIMP:
+
+    def __init__(self, IMP):
+        self.IMP        = IMP
+        self.elapsed    = 0.0
+
+    def __call__(self, *args):
+        start = timer()
+        try:
+            return self.IMP(*args)
+        finally:
+            self.elapsed += timer() - start
+
+    def __getattr__(self, name):
+        return getattr(self.IMP, name)
+
+swizzle_stats = SwizzleStats()
+
 # string.Template-like string interpolation
 class SimpleTemplate:
 
+    _param = re.compile(r'\$\{(.*?)\}')
+
     def __init__(self, template):
         self.template = template
+        # split the template once into the literal text and a resolver for
+        # every parameter, so substitute() only has to resolve and join
+        literals, resolvers = [], []
+        pos = 0
+        for match in self._param.finditer(template):
+            literals.append(template[pos:match.start()])
+            resolvers.append(self._resolver(match.group(1)))
+            pos = match.end()
+        literals.append(template[pos:])
+        self._head      = literals[0]
+        self._segments  = zip(resolvers, literals[1:])
 
-    def _substitute_param(self, param, params):
-        tokens  = param.split('.')
-        node    = params.get(tokens.pop(0))
-        while node and tokens:
-            node = getattr(node, tokens.pop(0), None)
-        if node == None:
-            return '${%s}' % param
-        return unicode(node)
+    @staticmethod
+    def _resolver(param):
+        tokens      = param.split('.')
+        name, attrs = tokens[0], tuple(tokens[1:])
+        unresolved  = '${%s}' % param
+        def resolve(params):
+            node = params.get(name)
+            for attr in attrs:
+                if not node:
+                    break
+                node = getattr(node, attr, None)
+            if node == None:
+                return unresolved
+            return unicode(node)
+        return resolve
 
     def _substitute(self, params):
-        expanded = self.template
-        expanded = re.sub(r'\$\{(.*?)\}',  lambda p: self._substitute_param(p.group(1), params), expanded)
-        return expanded
+        if not self._segments:
+            return self.template
+        parts = [ self._head ]
+        for resolve, text in self._segments:
+            parts.append(resolve(params))
+            parts.append(text)
+        return ''.join(parts)
 
     def substitute(self, params):
         return self._substitute(params)
-
-# unescape HTML-escaped string
-def htmlunescape(text):
-    def fixup(m):
-        text = m.group(0)
-        if text[:2] == "&#":
-            # character reference
-            try:
-                if text[:3] == "&#x":
-                    return unichr(int(text[3:-1], 16))
-                else:
-                    return unichr(int(text[2:-1]))
-            except ValueError:
-                pass
-        else:
-            # named entity
-            try:
-                text = unichr(htmlentitydefs.name2codepoint[text[1:-1]])
-            except KeyError:
-                pass
-        return text # leave as is
-    return re.sub("&#?\w+;", fixup, text)